@@ -2,16 +2,29 @@ import os
 import streamlit as st
 from streamlit_option_menu import option_menu
 import datetime
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import partial
 import uuid
-from fpdf import FPDF
-from google.cloud import dialogflowcx_v3beta1 as dialogflow_cx
-from google.oauth2 import service_account
-from google.cloud import firestore
-import base64
-import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
-import uuid
+from response_cache import ResponseCache
+from asset_registry import AssetRegistry
+from chat_history import ChatHistory
+from clients import ClientManager
+from jobs import JobQueue, QUEUED, FAILED, FINISHED_STATES
+from outbox import EmailOutbox
+from prompt_index import PromptIndex
+from governor import BackendError
+from sessions import SessionPool, ChatSession
+from generation import (
+    PROJECT_ID, AGENT_ID, LANGUAGE_CODE, BULK_RATE_CLASS, DIALOGFLOW_BULK_BURST, get_request_governor,
+    generate_task_description, detect_intent_text, stream_intent_text,
+)
+from task_catalog import TaskCatalog
+from state_store import BatchingStateWriter, FirestoreStateStore, MemoryStateStore, SQLiteStateStore
+from pdf_engine import create_pdf, create_multi_section_pdf, render_batch, bundle_zip
+import metrics
+from metrics import start_metrics_server
 # Set the page configuration
 st.set_page_config(page_title="PHBEE", page_icon="📚", layout="centered")
 
@@ -25,106 +38,142 @@ header {visibility: hidden;}
 """
 st.markdown(hide_st_style, unsafe_allow_html=True)
 
-# Load credentials from Streamlit secrets
-credentials_info = st.secrets["google_service_account_key"]
-credentials = service_account.Credentials.from_service_account_info(credentials_info)
-
 # Define the Dialogflow parameters
-project_id = "phoeb-426309"
-agent_id = "016dc67d-53e9-49c5-acbf-dcb3069154f9"
-language_code = "en"
-
-# Initialize clients
-def initialize_dialogflow_client(credentials):
-    return dialogflow_cx.SessionsClient(credentials=credentials)
-
-def initialize_firestore_client(credentials, project_id):
-    return firestore.Client(credentials=credentials, project=project_id)
-
-client = initialize_dialogflow_client(credentials)
-db = initialize_firestore_client(credentials, project_id)
+project_id = PROJECT_ID
+agent_id = AGENT_ID
+language_code = LANGUAGE_CODE
+
+# Process-wide clients, created on first use and shared by every session
+def load_credentials():
+    # Load credentials from Streamlit secrets
+    from google.oauth2 import service_account
+    credentials_info = st.secrets["google_service_account_key"]
+    return service_account.Credentials.from_service_account_info(credentials_info)
+
+# PHBEE_DIALOGFLOW_BACKEND=fake swaps in a local stand-in (see fake_dialogflow.py) for load tests
+DIALOGFLOW_BACKEND = os.environ.get("PHBEE_DIALOGFLOW_BACKEND", "live")
+
+@st.cache_resource
+def get_client_manager():
+    dialogflow_factory = None
+    if DIALOGFLOW_BACKEND == "fake":
+        from fake_dialogflow import FakeSessionsClient
+        dialogflow_factory = FakeSessionsClient.from_env
+    return ClientManager(load_credentials, project_id, dialogflow_factory=dialogflow_factory)
+
+def get_dialogflow_client():
+    return get_client_manager().dialogflow()
+
+# Response cache for deterministic task prompts
+CACHE_DB_PATH = "phbee_cache.sqlite3"
+
+@st.cache_resource
+def get_response_cache():
+    return ResponseCache(CACHE_DB_PATH)
+
+# Tasks pre-generated off-peak by prewarm.py
+CATALOG_DB_PATH = "phbee_catalog.sqlite3"
+
+@st.cache_resource
+def get_task_catalog():
+    return TaskCatalog(CATALOG_DB_PATH)
+
+# Dialogflow sessions: one-shot generation leases short-lived sessions from a pool,
+# the chat keeps one long-lived session whose context is trimmed every few turns
+ONE_SHOT_SESSION_MAX_USES = int(os.environ.get("PHBEE_SESSION_MAX_USES", "1"))
+ONE_SHOT_SESSION_TTL = datetime.timedelta(minutes=2)
+CHAT_CONTEXT_MAX_TURNS = int(os.environ.get("PHBEE_CHAT_MAX_TURNS", "20")) or None
+
+@st.cache_resource
+def get_session_pool():
+    return SessionPool(max_uses=ONE_SHOT_SESSION_MAX_USES)
 
 # Helper functions
 def generate_session_id():
     return str(uuid.uuid4())
 
-def img_to_base64(image_path):
-    try:
-        if not os.path.isfile(image_path):
-            raise FileNotFoundError(f"The file {image_path} does not exist.")
-        with open(image_path, "rb") as img_file:
-            img_data = img_file.read()
-        return base64.b64encode(img_data).decode('utf-8')
-    except FileNotFoundError as e:
-        st.error(f"Error: {str(e)}")
-        return base64.b64encode(b'').decode('utf-8')
-    except Exception as e:
-        st.error(f"An unexpected error occurred: {str(e)}")
-        return base64.b64encode(b'').decode('utf-8')
+def pdf_file_name(prefix):
+    return f"{prefix.replace(' ', '_')}_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf"
+
+def offer_pdf_download(pdf_bytes, file_name, label="Download PDF", mime='application/pdf'):
+    """Single download path for generated PDFs: raw bytes, sent once, never written to disk."""
+    st.download_button(
+        label=label,
+        data=pdf_bytes,
+        file_name=file_name,
+        mime=mime,
+        on_click="ignore",
+    )
 
-def create_pdf(task_description, response_text, file_name, task_type):
-    pdf = FPDF()
-    pdf.add_page()
-    pdf.set_font("Arial", size=12)
-    pdf.cell(200, 10, txt=f"{task_type.capitalize()} / Assessment", ln=True, align='C')
-    pdf.cell(200, 10, txt=datetime.datetime.now().strftime("%Y-%m-%d"), ln=True, align='C')
-    pdf.ln(10)
+def one_shot_detect_intent_text(services, text, rate_key=None, rate_class=None):
+    """Send a self-contained prompt on a pooled short-lived session."""
+    with services.session_pool.lease() as session_id:
+        return detect_intent_text(
+            services.clients.dialogflow(), project_id, agent_id, session_id, text, language_code,
+            rate_key=rate_key, session_ttl=ONE_SHOT_SESSION_TTL, rate_class=rate_class,
+        )
 
-    pdf.set_fill_color(200, 220, 255)
-    pdf.rect(x=10, y=30, w=190, h=pdf.get_y() + 10, style='F')
+def cached_detect_intent_text(services, text, force=False, rate_key=None, rate_class=None):
+    """Serve deterministic task prompts from the catalog or response cache, falling back to Dialogflow."""
+    entry = None if force else services.catalog.get(text, language_code)
+    if entry is not None:
+        return entry['response_text'], True
+    return services.cache.get_or_compute(
+        text,
+        lambda: one_shot_detect_intent_text(services, text, rate_key=rate_key, rate_class=rate_class),
+        language_code=language_code,
+        force=force,
+    )
 
-    pdf.set_xy(10, 40)
-    pdf.multi_cell(0, 10, txt=f"Task Description:\n{task_description}\n\nResponse:\n{response_text}")
+def show_cache_stats():
+    stats = get_response_cache().stats()
+    st.caption(
+        f"Response cache: {stats['memory_hits'] + stats['disk_hits']} hits, {stats['misses']} misses "
+        f"({stats['hit_rate']:.0%} hit rate, {stats['disk_entries']} stored)"
+    )
 
-    if task_type != "lesson plan":
-        memo = create_memo(response_text)
-        pdf.ln(10)
-        pdf.set_xy(10, pdf.get_y())
-        pdf.multi_cell(0, 10, txt=f"{memo}")
+# Chat avatars, encoded once per process at their displayed size
+USER_AVATAR_PATH = "image/PHBEE USER ICON.png"
+BOT_AVATAR_PATH = "image/PHBEE LOGO FINAL.png"
+AVATAR_SIZE = 40
 
-    pdf.output(file_name)
+@st.cache_resource
+def get_asset_registry():
+    registry = AssetRegistry()
+    registry.preload([path for path in (USER_AVATAR_PATH, BOT_AVATAR_PATH) if os.path.isfile(path)], AVATAR_SIZE)
+    return registry
 
-def detect_intent_text(client, project_id, agent_id, session_id, text, language_code="en"):
+def avatar_src(image_path):
     try:
-        session_path = f"projects/{project_id}/locations/global/agents/{agent_id}/sessions/{session_id}"
-        text_input = dialogflow_cx.TextInput(text=text)
-        query_input = dialogflow_cx.QueryInput(text=text_input, language_code=language_code)
-        request = dialogflow_cx.DetectIntentRequest(session=session_path, query_input=query_input)
-        response = client.detect_intent(request=request)
-        return response.query_result.response_messages[0].text.text[0] if response.query_result.response_messages else "No response from Dialogflow."
+        return get_asset_registry().data_uri(image_path, AVATAR_SIZE)
     except Exception as e:
-        st.error(f"Error detecting intent: {e}")
-        return "An error occurred while processing your request."
+        st.error(f"Error loading image {image_path}: {e}")
+        return "data:image/png;base64,"
 
-def display_message(sender, message):
+def message_html(sender, message):
     if sender == "user":
-        st.markdown(f'''
+        return f'''
             <div style="display: flex; align-items: center; margin-bottom: 10px; justify-content: flex-end;">
                 <div style="background-color: #f0f0f0; border-radius: 10px; padding: 10px; max-width: 70%; font-size: 16px; word-wrap: break-word;">
                     {message}
                 </div>
-                <img src="data:image/png;base64,{img_to_base64('image/PHBEE USER ICON.png')}" 
+                <img src="{avatar_src(USER_AVATAR_PATH)}" 
                      style="width: 40px; height: 40px; border-radius: 50%; margin-left: 10px;">
             </div>
-            ''', unsafe_allow_html=True)
+            '''
     else:
-        st.markdown(f'''
+        return f'''
             <div style="display: flex; align-items: center; margin-bottom: 10px; justify-content: flex-start;">
-                <img src="data:image/png;base64,{img_to_base64('image/PHBEE LOGO FINAL.png')}" 
+                <img src="{avatar_src(BOT_AVATAR_PATH)}" 
                      style="width: 40px; height: 40px; border-radius: 50%; margin-right: 10px;">
                 <div style="background-color: #DCF8C6; border-radius: 10px; padding: 10px; max-width: 70%; font-size: 16px; word-wrap: break-word;">
                     {message}
                 </div>
             </div>
-            ''', unsafe_allow_html=True)
+            '''
 
-def create_memo(response_text):
-    memo = "\nMemo:\n"
-    questions = response_text.split("\n")
-    for question in questions:
-        if "Answer:" in question:
-            memo += question + "\n"
-    return memo
+def display_message(sender, message):
+    st.markdown(message_html(sender, message), unsafe_allow_html=True)
 
 # Chatbot logic
 
@@ -136,21 +185,94 @@ def generate_session_id():
 
 
 
+# Chat history window
+CHAT_PAGE_SIZE = 20
+
+# Per-user state (identity, chat, running jobs) is kept in a shared store keyed by a
+# user ID carried in the URL, so any replica can serve any user and restarts lose nothing.
+# The ID works like a password: anyone with the link can read that user's chat.
+STATE_BACKEND = os.environ.get("PHBEE_STATE_BACKEND", "sqlite")
+STATE_DB_PATH = "phbee_state.sqlite3"
+USER_ID_PARAM = "sid"
+JOB_PAGES = ("task_generator", "free_task", "all_classwork")
+# Session-state keys that belong to one user and are reset when the URL switches users
+USER_STATE_KEYS = ('chat_history', 'chat_visible', 'chat_session', 'celebrated_job')
+
+def open_state_store(name):
+    """A store on the configured backend; ``name`` is the Firestore collection suffix or SQLite table."""
+    if STATE_BACKEND == "firestore":
+        # Bound here, on the script thread; the store's writer thread calls it later
+        return FirestoreStateStore(get_client_manager().firestore, collection=f"phbee_{name}")
+    if STATE_BACKEND == "memory":
+        return MemoryStateStore()
+    return SQLiteStateStore(STATE_DB_PATH, table=name)
+
+@st.cache_resource
+def get_state_store():
+    return BatchingStateWriter(open_state_store("user_state"))
+
+@st.cache_resource
+def get_job_result_store():
+    """Job status, results and files, shared like user state so any replica can show any job."""
+    return BatchingStateWriter(open_state_store("job_results"))
+
+def restore_user_state():
+    """Adopt the user ID from the URL (or issue one) and load that user's saved state once per browser session."""
+    user_id = st.query_params.get(USER_ID_PARAM)
+    if user_id and st.session_state.get('session_id') == user_id:
+        return
+    if not user_id:
+        user_id = st.session_state.get('session_id') or generate_session_id()
+        st.query_params[USER_ID_PARAM] = user_id
+    if st.session_state.get('session_id') != user_id:
+        # A different user: nothing of the previous one's may be shown or saved under the new ID
+        for key in USER_STATE_KEYS + tuple(map(job_state_key, JOB_PAGES)):
+            st.session_state.pop(key, None)
+    st.session_state['session_id'] = user_id
+
+    state = get_state_store().load(user_id) or {}
+    if 'chat_history' in state:
+        st.session_state['chat_history'] = ChatHistory.from_dict(state['chat_history'])
+        st.session_state['chat_visible'] = CHAT_PAGE_SIZE
+    if 'chat_session' in state:
+        st.session_state['chat_session'] = ChatSession.from_dict(state['chat_session'])
+    for page_key, job_id in state.get('jobs', {}).items():
+        st.session_state[job_state_key(page_key)] = job_id
+
+def save_user_state():
+    state = {
+        'jobs': {
+            page_key: st.session_state[job_state_key(page_key)]
+            for page_key in JOB_PAGES
+            if st.session_state.get(job_state_key(page_key))
+        },
+    }
+    if isinstance(st.session_state.get('chat_history'), ChatHistory):
+        state['chat_history'] = st.session_state['chat_history'].to_dict()
+    if isinstance(st.session_state.get('chat_session'), ChatSession):
+        state['chat_session'] = st.session_state['chat_session'].to_dict()
+    get_state_store().save(st.session_state['session_id'], state)
+
+def load_earlier_messages():
+    st.session_state['chat_visible'] += CHAT_PAGE_SIZE
+
 def chatbot():
     """Main function to handle the chatbot interaction."""
     # Initialize chat history and session ID
-    if 'chat_history' not in st.session_state:
-        st.session_state['chat_history'] = []
+    if not isinstance(st.session_state.get('chat_history'), ChatHistory):
+        st.session_state['chat_history'] = ChatHistory()
+        st.session_state['chat_visible'] = CHAT_PAGE_SIZE
 
     if 'session_id' not in st.session_state:
         st.session_state['session_id'] = generate_session_id()
+    if not isinstance(st.session_state.get('chat_session'), ChatSession):
+        st.session_state['chat_session'] = ChatSession(max_turns=CHAT_CONTEXT_MAX_TURNS)
+
+    history = st.session_state['chat_history']
 
     st.title("Chat with PHBEE 🐝")
     st.markdown("<h2 style='text-align: center;'>Welcome to the PHBEE Chatbot!</h2>", unsafe_allow_html=True)
-
-    # Initial bot greeting if no history exists
-    if not st.session_state['chat_history']:
-        display_message("PHBEE", "Greetings! I am PHBEE, your Educational AI assistant! How can I assist you today?")
+    st.caption("Your chat is saved under this page's link. Anyone you share the link with can read it.")
 
     # Input field for user input
     user_input = st.text_input(
@@ -160,30 +282,46 @@ def chatbot():
 
     # Send button to manually trigger sending the message
     if st.button("Send") and user_input:  # User can either press 'Send' or hit 'Enter'
-        with st.spinner('Processing...'):
-            response = detect_intent_text(client, project_id, agent_id, st.session_state['session_id'], user_input, "en")
+        try:
+            with st.spinner('Processing...'):
+                response = detect_intent_text(
+                    get_dialogflow_client(), project_id, agent_id, st.session_state['chat_session'].next_turn(),
+                    user_input, "en", rate_key=st.session_state['session_id'],
+                )
+        except BackendError as e:
+            st.error(f"Error detecting intent: {e}")
+        else:
+            # Append both messages to the chat history; they are rendered with the window below
+            history.append("user", user_input)
+            history.append("PHBEE", response)
+            save_user_state()
 
-        # Display user and bot messages
-        display_message("user", user_input)
-        display_message("PHBEE", response)
+    # Clear chat history button
+    if st.button("Clear Chat"):
+        history.clear()
+        st.session_state['chat_session'].rotate()
+        st.session_state['chat_visible'] = CHAT_PAGE_SIZE
+        save_user_state()
 
-        # Append both messages to the chat history
-        st.session_state['chat_history'].append({"sender": "user", "message": user_input})
-        st.session_state['chat_history'].append({"sender": "PHBEE", "message": response})
+    # Initial bot greeting if no history exists
+    if not history:
+        display_message("PHBEE", "Greetings! I am PHBEE, your Educational AI assistant! How can I assist you today?")
+        return
 
-        # Clear input field after sending the message
-        user_input = ""
+    # Page back through older messages on demand
+    if len(history) > st.session_state['chat_visible']:
+        st.button("Load earlier messages", on_click=load_earlier_messages)
+    visible = min(st.session_state['chat_visible'], len(history))
+    if visible < len(history):
+        st.caption(f"Showing the last {visible} of {len(history)} messages.")
+
+    # Display the visible window of chat history as a single block
+    st.markdown(
+        "".join(message_html(chat['sender'], chat['message']) for chat in history.recent(visible)),
+        unsafe_allow_html=True,
+    )
 
-    # Clear chat history button
-    if st.button("Clear Chat"):
-        st.session_state['chat_history'] = []
 
-    # Display chat history
-    for chat in st.session_state['chat_history']:
-        if isinstance(chat, dict) and 'sender' in chat and 'message' in chat:
-            display_message(chat['sender'], chat['message'])
-        else:
-            st.error("Chat history contains invalid data.")
 
 
 
@@ -191,21 +329,271 @@ def chatbot():
 
 
 
+# Bulk generation. One thread per call the user's bulk bucket admits at once, so a whole
+# year of lesson plans is in flight together; the process-wide rate limit still paces them.
+MAX_BULK_WORKERS = int(os.environ.get("PHBEE_BULK_WORKERS", DIALOGFLOW_BULK_BURST))
 
+def generate_bulk(services, items, force=False, max_workers=MAX_BULK_WORKERS, on_progress=None, rate_key=None):
+    """Generate many task prompts concurrently and return the results in input order.
 
-# Function to generate a task description
-def generate_task_description(task_type, subject, grade, curriculum, num_questions_or_term, total_marks_or_week):
-    if task_type == "lesson plan":
-        return (
-            f"Create a detailed {task_type} for the {subject} subject, targeting grade {grade} students under the "
-            f"{curriculum} curriculum. The lesson plan should cover term {num_questions_or_term} and week {total_marks_or_week}."
+    ``items`` is a list of dicts with ``label``, ``task_type`` and ``task_description``.
+    Each prompt runs on its own short-lived Dialogflow session so the calls don't
+    serialize on one conversation; ``rate_key`` keeps them all under the requesting
+    user's bulk rate limit, which is separate from (and larger than) the interactive one.
+    Failures are recorded per item instead of aborting the batch.
+    ``on_progress(done, total, result)`` is called from the calling thread, so it can
+    safely update Streamlit elements.
+    """
+    results = [None] * len(items)
+
+    def run(item):
+        response_text, from_cache = cached_detect_intent_text(
+            services, item['task_description'], force=force, rate_key=rate_key, rate_class=BULK_RATE_CLASS
         )
+        return dict(item, response_text=response_text, from_cache=from_cache, failed=False)
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(items)))) as executor:
+        futures = {executor.submit(run, item): index for index, item in enumerate(items)}
+        for done, future in enumerate(as_completed(futures), start=1):
+            index = futures[future]
+            try:
+                results[index] = future.result()
+            except Exception as e:
+                results[index] = dict(items[index], response_text=str(e), from_cache=False, failed=True)
+            if on_progress:
+                on_progress(done, len(items), results[index])
+    return results
+
+def lesson_plan_items(subject, grade, curriculum, terms, weeks):
+    return [
+        {
+            'label': f"Term {term}, Week {week}",
+            'task_type': "Lesson Plan",
+            'task_description': generate_task_description("Lesson Plan", subject, grade, curriculum, term, week),
+        }
+        for term in terms
+        for week in weeks
+    ]
+
+def assessment_pack_items(task_types, subject, grade, curriculum, num_questions, total_marks):
+    return [
+        {
+            'label': task_type,
+            'task_type': task_type,
+            'task_description': generate_task_description(task_type, subject, grade, curriculum, num_questions, total_marks),
+        }
+        for task_type in task_types
+    ]
+
+# Background generation jobs
+JOBS_DB_PATH = "phbee_jobs.sqlite3"
+JOB_WORKERS = 8
+JOB_POLL_SECONDS = 1
+# Pages stop waiting for a job that hasn't finished this long after it was submitted
+JOB_TIMEOUT_SECONDS = 15 * 60
+
+# Process-wide objects the job handlers use. Worker threads have no Streamlit script
+# context, so these are resolved once on the script thread and bound into the handlers.
+JobServices = namedtuple("JobServices", ["clients", "cache", "catalog", "session_pool", "prompt_index"])
+
+def run_task_job(services, payload, report):
+    """Job handler: generate one task, streaming partial text into the job's progress."""
+    with metrics.timer("job_task", page=payload.get('page')):
+        return generate_task_result(services, payload, report)
+
+def generate_task_result(services, payload, report):
+    page = payload.get('page')
+    started = time.perf_counter()
+    task_description = payload['task_description']
+    cache = services.cache
+    response_text = pdf_bytes = None
+    source = "backend"
+    if payload.get('reuse'):
+        response_text = payload['reuse']['response_text']
+        source = "reuse"
+    elif payload['cacheable'] and not payload['force']:
+        entry = services.catalog.get(task_description, language_code)
+        if entry is not None:
+            response_text = entry['response_text']
+            source = "catalog"
+            if entry['task_type'] == payload['task_type'] and payload['pdf_description'] == task_description:
+                pdf_bytes = entry['pdf']
+        else:
+            response_text = cache.get(task_description, language_code)
+            source = "cache"
+    from_cache = response_text is not None
+
+    metrics.increment("response_reuse_total", page=page, source=source if from_cache else "backend")
+
+    if not from_cache:
+        parts = []
+        with metrics.timer("dialogflow_stream", page=page), services.session_pool.lease() as session_id:
+            chunks = stream_intent_text(
+                services.clients.dialogflow(), project_id, agent_id, session_id, task_description, language_code,
+                rate_key=payload['session_id'], session_ttl=ONE_SHOT_SESSION_TTL,
+            )
+            for chunk in chunks:
+                if not parts:
+                    metrics.observe("time_to_first_chunk_seconds", time.perf_counter() - started, page=page)
+                parts.append(chunk)
+                report("".join(parts))
+        response_text = "".join(parts)
+        if payload['cacheable']:
+            cache.set(task_description, response_text, language_code)
+        if payload.get('index_prompt'):
+            services.prompt_index.add(task_description, response_text)
+
+    if pdf_bytes is None:
+        with metrics.timer("pdf_render", page=page):
+            pdf_bytes = create_pdf(payload['pdf_description'], response_text, payload['task_type'])
+    return {
+        'task_type': payload['task_type'],
+        'task_description': payload['pdf_description'],
+        'response_text': response_text,
+        'from_cache': from_cache,
+        'reused': payload.get('reuse'),
+        'file_name': pdf_file_name(payload['task_type']),
+        'artifact': pdf_bytes,
+    }
+
+def run_bulk_job(services, payload, report):
+    """Job handler: generate every item of a bulk request and merge them into one PDF."""
+    with metrics.timer("job_bulk", page=payload.get('page')):
+        return generate_bulk_result(services, payload, report)
+
+def generate_bulk_result(services, payload, report):
+    def on_progress(done, total, result):
+        status = "failed" if result['failed'] else "cached" if result['from_cache'] else "done"
+        report(f"Generated {done} of {total} ({result['label']}: {status})", done / total)
+
+    results = generate_bulk(services, payload['items'], force=payload['force'], on_progress=on_progress, rate_key=payload.get('session_id'))
+    succeeded = [result for result in results if not result['failed']]
+    if not succeeded:
+        raise RuntimeError("Nothing was generated. Please try again.")
+
+    report(f"Rendering {len(succeeded)} PDFs...", 1.0)
+    if payload.get('bundle') == 'zip':
+        # One PDF per item, rendered across the process pool and merged into a zip
+        with metrics.timer("pdf_render_batch", page=payload.get('page')):
+            pdfs = render_batch(succeeded)
+        return {
+            'results': results,
+            'file_name': pdf_file_name(payload['file_prefix'])[:-len(".pdf")] + ".zip",
+            'mime': 'application/zip',
+            'artifact': bundle_zip(
+                (pdf_file_name(f"{index:02d} {result['label']}"), pdf)
+                for index, (result, pdf) in enumerate(zip(succeeded, pdfs), start=1)
+            ),
+        }
+    with metrics.timer("pdf_render", page=payload.get('page')):
+        pdf_bytes = create_multi_section_pdf(succeeded)
+    return {
+        'results': results,
+        'file_name': pdf_file_name(payload['file_prefix']),
+        'artifact': pdf_bytes,
+    }
+
+@st.cache_resource
+def get_job_queue():
+    services = JobServices(
+        get_client_manager(), get_response_cache(), get_task_catalog(), get_session_pool(), get_prompt_index(),
+    )
+    handlers = {'task': partial(run_task_job, services), 'bulk': partial(run_bulk_job, services)}
+    return JobQueue(JOBS_DB_PATH, handlers=handlers, workers=JOB_WORKERS, result_store=get_job_result_store())
+
+def job_state_key(page_key):
+    return f"{page_key}_job"
+
+def submit_page_job(page_key, kind, payload):
+    """Queue a job for a page; its ID is kept in session state and the URL so it survives reruns and refreshes."""
+    # Create the shared client here so credential problems surface on the page, not in a worker
+    get_dialogflow_client()
+    job_id = get_job_queue().submit(kind, dict(payload, page=page_key))
+    st.session_state[job_state_key(page_key)] = job_id
+    st.query_params[job_state_key(page_key)] = job_id
+    save_user_state()
+    return job_id
+
+def forget_page_job(page_key):
+    st.session_state.pop(job_state_key(page_key), None)
+    st.query_params.pop(job_state_key(page_key), None)
+    save_user_state()
+
+def job_timed_out(job):
+    return job['status'] not in FINISHED_STATES and time.time() - job['created_at'] > JOB_TIMEOUT_SECONDS
+
+def show_page_job(page_key, render_result):
+    job_id = st.session_state.get(job_state_key(page_key)) or st.query_params.get(job_state_key(page_key))
+    if not job_id:
+        return
+    job = get_job_queue().get(job_id)
+    if job is None:
+        forget_page_job(page_key)
+        return
+    if job['status'] == FAILED:
+        st.error(f"An error occurred: {job['error']}")
+    elif job['status'] in FINISHED_STATES:
+        render_result(job)
+    elif job_timed_out(job):
+        st.error("This task is taking much longer than expected and may have been lost. Please try again.")
+        forget_page_job(page_key)
+    else:
+        poll_job(job_id)
+
+@st.fragment(run_every=JOB_POLL_SECONDS)
+def poll_job(job_id):
+    job = get_job_queue().get(job_id)
+    if job is None or job['status'] in FINISHED_STATES or job_timed_out(job):
+        st.rerun()
+    if job['status'] == QUEUED and job['queue_position']:
+        st.info(f"Waiting in queue (position {job['queue_position']})...")
+    elif job['status'] == QUEUED:
+        st.info("Waiting in queue...")
+    elif job['progress_fraction'] is not None:
+        st.progress(job['progress_fraction'], text=job['progress'])
     else:
-        return (
-            f"Create a detailed {task_type} for the {subject} subject, targeting grade {grade} students under the "
-            f"{curriculum} curriculum. The task should include {num_questions_or_term} questions, each with 4 options, "
-            f"and the total marks should sum up to {total_marks_or_week}."
+        st.caption("Generating, please wait...")
+        if job['progress']:
+            st.markdown(job['progress'])
+
+def render_task_result(job):
+    result = job['result']
+    if result.get('reused'):
+        st.info(
+            f"Reused the result of a similar earlier request ({result['reused']['similarity']:.0%} match): "
+            f"\"{result['reused']['prompt']}\". Choose 'Generate a new one' next time for a fresh version."
         )
+    elif result['from_cache']:
+        st.info("Served from cache. Tick 'Force regenerate' for a fresh version.")
+    st.markdown(f"**Generated {result['task_type']}:** {result['task_description']}")
+    st.markdown(f"**Response:** {result['response_text']}")
+    offer_pdf_download(job['artifact'], result['file_name'])
+
+def render_bulk_result(job):
+    results = job['result']['results']
+    failed = [result for result in results if result['failed']]
+    if failed:
+        st.warning(f"{len(failed)} of {len(results)} items failed: " + ", ".join(result['label'] for result in failed))
+    for result in results:
+        with st.expander(f"{result['label']}{' (failed)' if result['failed'] else ''}"):
+            st.write(f"**Task Description:** {result['task_description']}")
+            st.write(result['response_text'])
+    st.success(f"{len(results) - len(failed)} sections generated.")
+    if job['result'].get('mime') == 'application/zip':
+        offer_pdf_download(job['artifact'], job['result']['file_name'], label="Download PDFs (zip)", mime='application/zip')
+    else:
+        offer_pdf_download(job['artifact'], job['result']['file_name'], label="Download combined PDF")
+
+def task_job_payload(task_type, task_description, force=False, cacheable=True, pdf_description=None):
+    return {
+        'task_type': task_type,
+        'task_description': task_description,
+        'pdf_description': pdf_description or task_description,
+        'force': force,
+        'cacheable': cacheable,
+        # Identifies the user for rate limiting; generation itself runs on a pooled session
+        'session_id': st.session_state.setdefault('session_id', generate_session_id()),
+    }
 
 # Task Generator logic
 def task_generator():
@@ -222,48 +610,77 @@ def task_generator():
     curriculum = st.radio("Curriculum", ["CAPS", "IEB"])
 
     # Conditional inputs based on task type
+    bulk_items = None
     if task_type == "Lesson Plan":
-        term = st.slider("Term", 1, 4)
-        week = st.slider("Week", 1, 10)
-        num_questions_or_term = term
-        total_marks_or_week = week
+        scope = st.radio("Lesson plans to generate", ["Single week", "Whole term", "Whole year"], horizontal=True)
+        if scope == "Whole year":
+            bulk_items = lesson_plan_items(subject, grade, curriculum, range(1, 5), range(1, 11))
+            num_questions_or_term = total_marks_or_week = None
+        else:
+            term = st.slider("Term", 1, 4)
+            num_questions_or_term = term
+            if scope == "Whole term":
+                bulk_items = lesson_plan_items(subject, grade, curriculum, [term], range(1, 11))
+                total_marks_or_week = None
+            else:
+                week = st.slider("Week", 1, 10)
+                total_marks_or_week = week
     else:
         num_questions = st.slider("Number of Questions", 1, 10)
         total_marks = st.slider("Total Marks", 1, 100)
         num_questions_or_term = num_questions
         total_marks_or_week = total_marks
+        if st.checkbox("Generate a full assessment pack"):
+            pack_types = st.multiselect(
+                "Task types in the pack",
+                ["Assessment", "Project", "Test", "Exam"],
+                default=["Assessment", "Project", "Test", "Exam"],
+            )
+            bulk_items = assessment_pack_items(pack_types, subject, grade, curriculum, num_questions, total_marks)
 
+    force_regenerate = st.checkbox("Force regenerate (skip cached result)")
+
+    if bulk_items is not None:
+        bundle = st.radio("Download as", ["One combined PDF", "Separate PDFs (zip)"], horizontal=True)
+        if st.button(f"Generate {len(bulk_items)} Tasks"):
+            if not subject or not bulk_items:
+                st.error("Please enter a subject and select at least one task.")
+            else:
+                submit_page_job("task_generator", 'bulk', {
+                    'items': bulk_items,
+                    'force': force_regenerate,
+                    'file_prefix': f"{task_type} Pack",
+                    'bundle': 'zip' if bundle == "Separate PDFs (zip)" else 'pdf',
+                    'session_id': st.session_state['session_id'],
+                })
     # Generate task button
-    if st.button("Generate Task"):
-        try:
-            with st.spinner('Generating task, please wait...'):
-                # Generate task description and detect intent
-                task_description = generate_task_description(task_type, subject, grade, curriculum, num_questions_or_term, total_marks_or_week)
-                response_text = detect_intent_text(client, project_id, agent_id, st.session_state['session_id'], task_description)
-
-                # Show the response text to the user
-                st.subheader("Generated Task Description and Response")
-                st.write(f"**Task Type:** {task_type}")
-                st.write(f"**Task Description:** {task_description}")
-                st.write(f"**Response from Intent Detection:** {response_text}")
-
-                # Create the PDF file
-                file_name = f"{task_type.replace(' ', '_')}_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf"
-                create_pdf(task_description, response_text, file_name, task_type)
-
-            # Show success message and balloons when task is ready
-            st.success(f"Task generated and saved as {file_name}.")
-            st.balloons()
-
-            # Provide a download button for the generated PDF
-            st.download_button(
-                label="Download PDF",
-                data=open(file_name, "rb").read(),
-                file_name=file_name,
-                mime='application/pdf'
-            )
-        except Exception as e:
-            st.error(f"An error occurred: {e}")
+    elif st.button("Generate Task"):
+        task_description = generate_task_description(task_type, subject, grade, curriculum, num_questions_or_term, total_marks_or_week)
+        submit_page_job("task_generator", 'task', task_job_payload(task_type, task_description, force=force_regenerate))
+
+    show_page_job("task_generator", render_task_generator_result)
+
+def render_task_generator_result(job):
+    if job['kind'] == 'bulk':
+        render_bulk_result(job)
+        return
+
+    st.subheader("Generated Task Description and Response")
+    render_task_result(job)
+    show_cache_stats()
+
+    # Show success message and balloons when a task is first ready
+    st.success("Task generated.")
+    if st.session_state.get('celebrated_job') != job['id']:
+        st.session_state['celebrated_job'] = job['id']
+        st.balloons()
+
+# Near-duplicate reuse for free-form requests
+PROMPT_INDEX_DB_PATH = "phbee_prompts.sqlite3"
+
+@st.cache_resource
+def get_prompt_index():
+    return PromptIndex(PROMPT_INDEX_DB_PATH)
 
 # Free Task logic
 def free_task():
@@ -271,28 +688,48 @@ def free_task():
     st.markdown("Generate a custom PDF based on your request.")
 
     request_text = st.text_area("Enter your request")
+    suggest_similar = st.checkbox("Suggest similar earlier results", value=True)
     if st.button("Generate Free Task"):
         if request_text.strip():
-            with st.spinner("Generating..."):
-                response_text = detect_intent_text(client, project_id, agent_id, st.session_state['session_id'], request_text)
-                
-                pdf_file_name = f"Free_Task_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf"
-                create_pdf(request_text, response_text, pdf_file_name, "Free Task")
-
-                st.markdown(f"**Generated PDF:** {request_text}")
-                st.markdown(f"**Response:** {response_text}")
-
-                # Provide a download link for the PDF
-                st.markdown(f"""
-                    <a href="data:application/octet-stream;base64,{base64.b64encode(open(pdf_file_name, 'rb').read()).decode()}" download="{pdf_file_name}">
-                    <div style="background-color: #FFCC00; color: white; padding: 10px; border-radius: 5px; text-align: center; max-width: 200px;">
-                        Download {pdf_file_name}
-                    </div>
-                    </a>
-                """, unsafe_allow_html=True)
+            match = get_prompt_index().lookup(request_text) if suggest_similar else None
+            if match:
+                # Only offer the earlier result; nothing is reused until the user accepts it
+                st.session_state['free_task_offer'] = {
+                    'request': request_text, 'prompt': match.prompt, 'response_text': match.response,
+                    'similarity': match.similarity,
+                }
+            else:
+                submit_free_task(request_text)
         else:
             st.error("Please enter a valid request.")
 
+    offer = st.session_state.get('free_task_offer')
+    if offer and offer['request'] != request_text:
+        st.session_state.pop('free_task_offer')
+    elif offer:
+        st.info(
+            f"A similar earlier request ({offer['similarity']:.0%} match): \"{offer['prompt']}\". "
+            "Use this earlier result?"
+        )
+        use_column, new_column = st.columns(2)
+        if use_column.button("Use this earlier result"):
+            st.session_state.pop('free_task_offer')
+            submit_free_task(request_text, reuse={key: offer[key] for key in ('prompt', 'response_text', 'similarity')})
+            st.rerun()
+        if new_column.button("Generate a new one"):
+            st.session_state.pop('free_task_offer')
+            submit_free_task(request_text)
+            st.rerun()
+
+    show_page_job("free_task", render_task_result)
+
+def submit_free_task(request_text, reuse=None):
+    payload = task_job_payload("Free Task", request_text, cacheable=False)
+    payload['index_prompt'] = True
+    if reuse:
+        payload['reuse'] = reuse
+    submit_page_job("free_task", 'task', payload)
+
 # All Classwork logic
 def all_classwork():
     st.subheader("All Classwork")
@@ -309,6 +746,7 @@ def all_classwork():
     subject = st.text_input("Enter subject name", placeholder="e.g., English, Math")
     grade = st.number_input("Select grade", min_value=1, max_value=12, step=1)
     curriculum = st.radio("Select curriculum", ["CAPS", "IEB"])
+    force_regenerate = st.checkbox("Force regenerate (skip cached result)")
 
     # Handle Explainer and Summary differently (no marks, focus on concepts)
     if task_type in ["Explainer", "Summary"]:
@@ -316,24 +754,7 @@ def all_classwork():
         if st.button(f"Generate {task_type}"):
             if subject and grade and curriculum and explanation_topic:
                 task_description = f"Create a detailed {task_type} on {explanation_topic} for {subject} (Grade {grade}, {curriculum}). Focus on explaining the concept in a clear and engaging way."
-                with st.spinner("Generating..."):
-                    response_text = detect_intent_text(client, project_id, agent_id, st.session_state['session_id'], task_description)
-
-                st.markdown(f"**Generated {task_type}:** {task_description}")
-                st.markdown(f"**Response:** {response_text}")
-                
-                # Generate PDF
-                pdf_file_name = f"{task_type.replace(' ', '_')}_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf"
-                create_pdf(task_description, response_text, pdf_file_name, task_type)
-
-                # Provide a download link for the PDF
-                st.markdown(f"""
-                <a href="data:application/octet-stream;base64,{base64.b64encode(open(pdf_file_name, 'rb').read()).decode()}" download="{pdf_file_name}">
-                <div style="background-color: #FFCC00; color: white; padding: 10px; border-radius: 5px; text-align: center; max-width: 200px;">
-                Download {pdf_file_name}
-                </div>
-                </a>
-                """, unsafe_allow_html=True)
+                submit_page_job("all_classwork", 'task', task_job_payload(task_type, task_description, force=force_regenerate))
             else:
                 st.error("Please provide all required inputs.")
     else:
@@ -343,59 +764,57 @@ def all_classwork():
         if st.button(f"Generate {task_type}"):
             if subject and grade and curriculum:
                 task_description = generate_task_description(task_type, subject, grade, curriculum, num_questions, total_marks)
-                with st.spinner("Generating..."):
-                    response_text = detect_intent_text(client, project_id, agent_id, st.session_state['session_id'], task_description)
-
-                st.markdown(f"**Generated {task_type}:** {task_description}")
-                st.markdown(f"**Response:** {response_text}")
-                
-                # Generate PDF
-                pdf_file_name = f"{task_type.replace(' ', '_')}_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf"
-                create_pdf(task_description, response_text, pdf_file_name, task_type)
-
-                # Provide a download link for the PDF
-                st.markdown(f"""
-                <a href="data:application/octet-stream;base64,{base64.b64encode(open(pdf_file_name, 'rb').read()).decode()}" download="{pdf_file_name}">
-                <div style="background-color: #FFCC00; color: white; padding: 10px; border-radius: 5px; text-align: center; max-width: 200px;">
-                Download {pdf_file_name}
-                </div>
-                </a>
-                """, unsafe_allow_html=True)
+                submit_page_job("all_classwork", 'task', task_job_payload(task_type, task_description, force=force_regenerate))
             else:
                 st.error("Please provide all required inputs.")
 
+    show_page_job("all_classwork", render_task_result)
+
+# Email outbox: feedback is persisted and acknowledged at once, then sent in the background
+OUTBOX_DB_PATH = "phbee_outbox.sqlite3"
+FEEDBACK_EMAIL = "maandaskate60@gmail.com"
+
+# SMTP server settings come from the [email] secrets (smtp_host, smtp_port, smtp_starttls,
+# smtp_ssl); PHBEE_SMTP_* environment variables override them, e.g. to use a local stand-in
+def smtp_setting(email_secrets, name, default):
+    return os.environ.get(f"PHBEE_SMTP_{name.upper()}", email_secrets.get(f"smtp_{name}", default))
+
+def is_enabled(value):
+    return str(value).lower() in ("1", "true", "yes", "on")
+
+@st.cache_resource
+def get_outbox():
+    email_secrets = st.secrets["email"]
+    use_ssl = is_enabled(smtp_setting(email_secrets, "ssl", False))
+    smtp_factory = None
+    if use_ssl:
+        import smtplib
+        smtp_factory = smtplib.SMTP_SSL
+    return EmailOutbox(
+        OUTBOX_DB_PATH, email_secrets["email"], email_secrets.get("email_password"),
+        host=smtp_setting(email_secrets, "host", "smtp.gmail.com"),
+        port=int(smtp_setting(email_secrets, "port", 465 if use_ssl else 587)),
+        use_starttls=not use_ssl and is_enabled(smtp_setting(email_secrets, "starttls", True)),
+        smtp_factory=smtp_factory,
+    )
+
 # Send Email Function
 def send_email(to_email, subject, body):
+    """Queue an email for background delivery. Returns the outbox message ID, or None on failure."""
     try:
-        from_email = st.secrets["email"]["email"]
-        email_password = st.secrets["email"]["email_password"]
+        with metrics.timer("email_enqueue", page="feedback"):
+            return get_outbox().enqueue(to_email, subject, body)
     except KeyError as e:
         st.error(f"Error: Missing secret key {e}")
-        return
-
-    msg = MIMEMultipart()
-    msg["From"] = from_email
-    msg["To"] = to_email
-    msg["Subject"] = subject
-    msg.attach(MIMEText(body, "plain"))
-
-    try:
-        server = smtplib.SMTP("smtp.gmail.com", 587)
-        server.starttls()
-        server.login(from_email, email_password)
-        server.sendmail(from_email, to_email, msg.as_string())
-        server.quit()
-        st.success("Email sent successfully!")
-    except smtplib.SMTPAuthenticationError as e:
-        st.error(f"Authentication error: {e}")
     except Exception as e:
         st.error(f"An error occurred: {e}")
+    return None
 
 # Function to submit feedback
 def submit_feedback(rating, best_feature, feedback, contact_info):
     email_body = f"Rating: {rating}\nBest Feature: {best_feature}\nFeedback: {feedback}\nContact Info: {contact_info}"
-    send_email("maandaskate60@gmail.com", "PHBEE Feedback Submission", email_body)
-    st.success("Thank you for your feedback! We've emailed it to our support team.")
+    if send_email(FEEDBACK_EMAIL, "PHBEE Feedback Submission", email_body) is not None:
+        st.success("Thank you for your feedback! It will be emailed to our support team shortly.")
 
 # Feedback form
 def feedback_form():
@@ -416,8 +835,62 @@ def feedback_form():
     if st.button("Submit Feedback"):
         submit_feedback(rating, best_feature, feedback, contact_info)
 
+# Metrics endpoint and admin panel
+METRICS_PORT = int(os.environ.get("PHBEE_METRICS_PORT", "9108"))
+SHOW_ADMIN_PANEL = os.environ.get("PHBEE_ADMIN_PANEL") == "1"
+
+metrics.registry.describe("job_artifact_bytes_total", "Bytes of generated files (PDFs, zips), counted once per job")
+metrics.registry.describe("response_reuse_total", "Generated tasks by where the response came from")
+metrics.registry.describe("time_to_first_chunk_seconds", "Seconds from job start until the first response text")
+metrics.registry.describe("governor_throttled_total", "Dialogflow calls delayed waiting for a rate-limit token")
+metrics.registry.describe("governor_rejected_total", "Dialogflow calls rejected by the rate limiter or the open circuit breaker")
+metrics.registry.describe("governor_retries_total", "Dialogflow calls retried after a retryable error")
+metrics.registry.describe("circuit_breaker_transitions_total", "Dialogflow circuit breaker state changes")
+metrics.registry.describe("dialogflow_sessions_created_total", "Dialogflow sessions started, by one-shot or chat use")
+
+@st.cache_resource
+def start_metrics_endpoint():
+    return start_metrics_server(METRICS_PORT)
+
+def admin_panel():
+    with st.expander("Admin: metrics"):
+        snapshot = metrics.registry.snapshot()
+        st.dataframe(
+            [
+                {
+                    'stage': summary['labels'].get('stage', summary['name']),
+                    'page': summary['labels'].get('page', ''),
+                    'count': summary['count'],
+                    'p50 ms': round(summary['p50'] * 1000, 1),
+                    'p95 ms': round(summary['p95'] * 1000, 1),
+                    'p99 ms': round(summary['p99'] * 1000, 1),
+                }
+                for summary in snapshot['summaries']
+            ],
+            hide_index=True,
+        )
+        st.dataframe(
+            [
+                {'counter': counter['name'], 'labels': ", ".join(f"{k}={v}" for k, v in counter['labels'].items()), 'value': counter['value']}
+                for counter in snapshot['counters']
+            ],
+            hide_index=True,
+        )
+        governor = get_request_governor()
+        st.caption(f"Dialogflow: circuit {governor.breaker.state}, {governor.rate:.1f} requests/s allowed")
+        pool = get_session_pool().stats()
+        state = get_state_store().stats()
+        st.caption(f"User state ({STATE_BACKEND}): {state['writes']} writes in {state['batches']} batches, {state['pending']} pending")
+        st.caption(f"One-shot sessions: {pool['created']} created, {pool['reused']} reused, {pool['in_use']} in use")
+        assets = get_asset_registry().stats()
+        st.caption(f"Avatar assets: {assets['hits']} hits, {assets['misses']} encodes, {assets['bytes_cached'] / 1024:.0f} KiB cached")
+        st.caption(f"Prometheus endpoint: http://127.0.0.1:{METRICS_PORT}/metrics")
+
 # Main function to handle page navigation
 def main():
+    start_metrics_endpoint()
+    restore_user_state()
+
     # Sidebar menu with icons
     with st.sidebar:
         selected = option_menu(
@@ -427,7 +900,13 @@ def main():
             menu_icon="cast",
             default_index=0,
         )
+        if SHOW_ADMIN_PANEL:
+            admin_panel()
+
+    with metrics.timer("page_render", page=selected.lower().replace(" ", "_")):
+        render_page(selected)
 
+def render_page(selected):
     # Page content logic based on selection
     if selected == "Home":
         st.title('Welcome to PHBEE :rocket:')
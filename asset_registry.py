@@ -0,0 +1,64 @@
+import base64
+import io
+import threading
+
+from PIL import Image
+
+import metrics
+
+
+class AssetRegistry:
+    """Process-wide cache of images encoded as data URIs.
+
+    Each (path, size) pair is read, optionally downsized and base64-encoded once;
+    every later lookup is a dictionary hit, so rendering chat messages does no
+    file I/O.
+    """
+
+    def __init__(self):
+        self._encoded = {}
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "bytes_cached": 0}
+
+    def data_uri(self, image_path, size=None):
+        key = (image_path, size)
+        with self._lock:
+            uri = self._encoded.get(key)
+            if uri is not None:
+                self._stats["hits"] += 1
+                return uri
+        uri = self._encode(image_path, size)
+        with self._lock:
+            if key not in self._encoded:
+                self._encoded[key] = uri
+                self._stats["misses"] += 1
+                self._stats["bytes_cached"] += len(uri)
+            return self._encoded[key]
+
+    def preload(self, image_paths, size=None):
+        for image_path in image_paths:
+            self.data_uri(image_path, size)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = len(self._encoded)
+        return stats
+
+    def _encode(self, image_path, size):
+        with metrics.timer("asset_encode"):
+            return self._encode_uncached(image_path, size)
+
+    def _encode_uncached(self, image_path, size):
+        if size is None:
+            with open(image_path, "rb") as img_file:
+                img_data = img_file.read()
+        else:
+            # Downsize to the displayed size so every message carries a few KB, not the full PNG
+            with Image.open(image_path) as image:
+                image = image.convert("RGBA")
+                image.thumbnail((size, size), Image.LANCZOS)
+                buffer = io.BytesIO()
+                image.save(buffer, format="PNG", optimize=True)
+                img_data = buffer.getvalue()
+        return "data:image/png;base64," + base64.b64encode(img_data).decode("utf-8")
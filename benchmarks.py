@@ -0,0 +1,215 @@
+"""Micro-benchmarks for the app's hot pure functions at production data sizes.
+
+Times prompt building, memo extraction, PDF rendering, avatar lookup and the
+chat window on realistic and worst-case inputs (100-question exams, multi-page
+lesson plans, 500-message chat histories). Results can be saved as a baseline
+and later runs compared against it; ``--check`` exits non-zero when a
+benchmark got slower than the baseline by more than the tolerance. Baselines
+are machine-specific, so they are not committed; save one before comparing.
+
+    python benchmarks.py
+    python benchmarks.py --save-baseline
+    python benchmarks.py --check --tolerance 0.25
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import timeit
+
+from fake_dialogflow import QUESTION_TEMPLATE
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_BASELINE = os.path.join(APP_DIR, "benchmarks_baseline.json")
+DEFAULT_TOLERANCE = 0.25
+# Regressions are judged on the best run, which is the least disturbed by other load on
+# the machine; benchmarks faster than this are too noisy to gate on and never count as regressions
+NOISE_FLOOR_SECONDS = 100e-6
+
+
+def exam_text(questions):
+    return "".join(QUESTION_TEMPLATE.format(number=number, answer="ABCD"[number % 4]) for number in range(1, questions + 1))
+
+
+def lesson_plan_text(weeks, paragraphs_per_week=6):
+    paragraph = (
+        "Learners work in pairs to model the concept with concrete materials, then record their reasoning "
+        "in their workbooks. The teacher circulates, asks probing questions and notes misconceptions for "
+        "the reflection at the end of the lesson.\n"
+    )
+    return "".join(
+        f"Week {week}: Objectives, activities and assessment\n" + paragraph * paragraphs_per_week
+        for week in range(1, weeks + 1)
+    )
+
+
+def chat_history(count):
+    from chat_history import ChatHistory
+    history = ChatHistory()
+    for index in range(count):
+        history.append("user" if index % 2 == 0 else "PHBEE",
+                       f"Message {index}: " + ("Can you explain equivalent fractions with an example? " * (1 + index % 4)))
+    return history
+
+
+def load_app(workdir):
+    """Import app.py in Streamlit's bare mode (no server, page calls are no-ops) with throwaway state."""
+    os.environ.update({"PHBEE_METRICS_PORT": "0", "PHBEE_STATE_BACKEND": "memory"})
+    os.symlink(os.path.join(APP_DIR, "image"), os.path.join(workdir, "image"))
+    os.chdir(workdir)
+    sys.path.insert(0, APP_DIR)
+    import app
+    # Every page call logs a "missing ScriptRunContext" warning in bare mode; don't time the logging
+    for name in list(logging.root.manager.loggerDict):
+        if name.startswith("streamlit"):
+            logging.getLogger(name).setLevel(logging.ERROR)
+    return app
+
+
+def build_benchmarks(app):
+    from generation import generate_task_description
+    from pdf_engine import create_memo, create_multi_section_pdf, create_pdf
+
+    exam_10, exam_100 = exam_text(10), exam_text(100)
+    lesson_plan = lesson_plan_text(weeks=10)
+    history = chat_history(500)
+    history_state = history.to_dict()
+    page_size = app.CHAT_PAGE_SIZE
+    registry = app.get_asset_registry()
+    term_of_lesson_plans = [
+        {'task_description': f"Lesson plan, week {week}", 'response_text': lesson_plan_text(weeks=1), 'task_type': "Lesson Plan"}
+        for week in range(1, 11)
+    ]
+    assessment_pack = [
+        {'task_description': task_type, 'response_text': exam_10, 'task_type': task_type}
+        for task_type in ("Assessment", "Project", "Test", "Exam")
+    ]
+
+    def chat_window():
+        # What the Chatbot page renders on every turn
+        return "".join(app.message_html(chat['sender'], chat['message']) for chat in history.recent(page_size))
+
+    return {
+        "generate_task_description/assessment": lambda: generate_task_description("Assessment", "Mathematics", "10", "CAPS", 10, 50),
+        "generate_task_description/lesson_plan": lambda: generate_task_description("Lesson Plan", "Life Sciences", "R", "IEB", 4, 10),
+        "create_memo/10_questions": lambda: create_memo(exam_10),
+        "create_memo/100_questions": lambda: create_memo(exam_100),
+        "create_memo/lesson_plan_10_weeks": lambda: create_memo(lesson_plan),
+        "create_pdf/assessment_10_questions": lambda: create_pdf("Assessment", exam_10, "Assessment"),
+        "create_pdf/exam_100_questions": lambda: create_pdf("Exam", exam_100, "Exam"),
+        "create_pdf/lesson_plan_10_weeks": lambda: create_pdf("Lesson Plan", lesson_plan, "Lesson Plan"),
+        "create_multi_section_pdf/term_of_lesson_plans": lambda: create_multi_section_pdf(term_of_lesson_plans),
+        "create_multi_section_pdf/assessment_pack": lambda: create_multi_section_pdf(assessment_pack),
+        "asset_registry/data_uri": lambda: registry.data_uri(app.BOT_AVATAR_PATH, app.AVATAR_SIZE),
+        "avatar_src/user": lambda: app.avatar_src(app.USER_AVATAR_PATH),
+        "message_html/single": lambda: app.message_html("PHBEE", "Can you explain equivalent fractions with an example?"),
+        "chat_window/latest_page_of_500": chat_window,
+        "chat_history/recent_page_of_500": lambda: history.recent(page_size),
+        "chat_history/recent_300_of_500": lambda: history.recent(300),
+        "chat_history/to_dict_500": history.to_dict,
+        "chat_history/from_dict_500": lambda: type(history).from_dict(history_state),
+    }
+
+
+def measure(function, repeat):
+    """Seconds per call: best and median over ``repeat`` runs of an auto-sized loop."""
+    timer = timeit.Timer(function)
+    number, _ = timer.autorange()
+    runs = [total / number for total in timer.repeat(repeat=repeat, number=number)]
+    return {"best": min(runs), "median": statistics.median(runs), "loops": number}
+
+
+def calibrate(repeat):
+    """Seconds per call of a fixed pure-Python workload: how fast this machine is right now."""
+    return measure(lambda: sorted(str(number) for number in range(2000)), repeat)["best"]
+
+
+def compare(results, baseline, tolerance, scale=1.0):
+    """Names of benchmarks whose best time is slower than the baseline by more than ``tolerance``.
+
+    Baseline times are multiplied by ``scale``, the machine's current speed relative to
+    when the baseline was saved, so a machine that is busy as a whole flags nothing.
+    """
+    regressions = []
+    for name, result in results.items():
+        reference = baseline.get(name)
+        if reference is None or result["best"] < NOISE_FLOOR_SECONDS:
+            continue
+        if result["best"] > reference["best"] * scale * (1 + tolerance):
+            regressions.append(name)
+    return regressions
+
+
+def format_seconds(seconds):
+    for unit, scale in (("s", 1), ("ms", 1e-3), ("us", 1e-6)):
+        if seconds >= scale:
+            return f"{seconds / scale:.2f} {unit}"
+    return f"{seconds / 1e-9:.0f} ns"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--filter", default="", help="only run benchmarks whose name contains this text")
+    parser.add_argument("--repeat", type=int, default=5, help="timing runs per benchmark")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="baseline file to compare against or save")
+    parser.add_argument("--save-baseline", action="store_true", help="store these results as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE,
+                        help="allowed slowdown against the baseline, as a fraction")
+    parser.add_argument("--check", action="store_true", help="exit non-zero when a benchmark regressed")
+    args = parser.parse_args(argv)
+
+    baseline_path = os.path.abspath(args.baseline)
+    baseline, baseline_calibration = {}, None
+    if os.path.isfile(baseline_path):
+        with open(baseline_path) as baseline_file:
+            saved = json.load(baseline_file)
+        baseline, baseline_calibration = saved["results"], saved.get("calibration")
+
+    with tempfile.TemporaryDirectory(prefix="phbee-bench-") as workdir:
+        benchmarks = build_benchmarks(load_app(workdir))
+        calibration = calibrate(args.repeat)
+        results = {}
+        for name, function in benchmarks.items():
+            if args.filter not in name:
+                continue
+            results[name] = measure(function, args.repeat)
+        calibration = (calibration + calibrate(args.repeat)) / 2
+        scale = calibration / baseline_calibration if baseline_calibration else 1.0
+        # A burst of load elsewhere on the machine can slow a single benchmark; only
+        # count a regression if it is still there when measured again
+        for name in compare(results, baseline, args.tolerance, scale):
+            retry = measure(benchmarks[name], args.repeat * 2)
+            if retry["best"] < results[name]["best"]:
+                results[name] = retry
+
+    regressions = compare(results, baseline, args.tolerance, scale)
+    if baseline_calibration:
+        print(f"Machine speed against the baseline: x{1 / scale:.2f} (baseline times are scaled to match)")
+    print(f"{'benchmark':<48}{'median':>12}{'best':>12}{'baseline':>12}{'change':>9}")
+    for name, result in results.items():
+        reference = baseline.get(name)
+        change = f"{result['best'] / (reference['best'] * scale) - 1:+.0%}" if reference else ""
+        flag = "  REGRESSED" if name in regressions else ""
+        print(f"{name:<48}{format_seconds(result['median']):>12}{format_seconds(result['best']):>12}"
+              f"{format_seconds(reference['best'] * scale) if reference else '-':>12}{change:>9}{flag}")
+
+    if args.save_baseline:
+        with open(baseline_path, "w") as baseline_file:
+            results = dict(baseline, **results)
+            json.dump({"python": platform.python_version(), "machine": platform.machine(),
+                       "calibration": calibration, "results": results},
+                      baseline_file, indent=2, sort_keys=True)
+            baseline_file.write("\n")
+        print(f"Saved baseline to {baseline_path}")
+    if regressions:
+        print(f"{len(regressions)} benchmark(s) slower than the baseline by more than {args.tolerance:.0%}")
+        return 1 if args.check else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
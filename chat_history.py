@@ -0,0 +1,82 @@
+import base64
+import json
+import zlib
+from collections import deque
+
+
+class ChatHistory:
+    """Bounded chat transcript for windowed rendering.
+
+    The newest ``max_recent`` messages are kept as plain dicts. Older messages are
+    compacted into zlib-compressed JSON chunks, of which at most ``max_chunks`` are
+    kept; anything older than that is dropped. Appending is O(1) and reading the
+    last N messages only touches the chunks that window actually needs.
+    """
+
+    def __init__(self, max_recent=200, chunk_size=50, max_chunks=40):
+        self.max_recent = max_recent
+        self.chunk_size = chunk_size
+        self._recent = deque()
+        self._chunks = deque(maxlen=max_chunks)
+        self._archived = 0
+        self.dropped = 0
+
+    def __len__(self):
+        return self._archived + len(self._recent)
+
+    def __bool__(self):
+        return len(self) > 0
+
+    def append(self, sender, message):
+        self._recent.append({"sender": sender, "message": message})
+        if len(self._recent) > self.max_recent:
+            self._compact()
+
+    def recent(self, count):
+        """Return up to ``count`` of the newest messages, oldest first."""
+        if count <= len(self._recent):
+            return list(self._recent)[len(self._recent) - count:]
+
+        needed = count - len(self._recent)
+        older = []
+        for size, blob in reversed(self._chunks):
+            older[:0] = json.loads(zlib.decompress(blob))
+            if len(older) >= needed:
+                break
+        return older[max(0, len(older) - needed):] + list(self._recent)
+
+    def to_dict(self):
+        """Compact JSON-serializable form; archived chunks stay compressed."""
+        return {
+            "max_recent": self.max_recent,
+            "chunk_size": self.chunk_size,
+            "max_chunks": self._chunks.maxlen,
+            "recent": [[message["sender"], message["message"]] for message in self._recent],
+            "chunks": [[size, base64.b64encode(blob).decode("ascii")] for size, blob in self._chunks],
+            "dropped": self.dropped,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        history = cls(data["max_recent"], data["chunk_size"], data["max_chunks"])
+        history._recent.extend({"sender": sender, "message": message} for sender, message in data["recent"])
+        history._chunks.extend((size, base64.b64decode(blob)) for size, blob in data["chunks"])
+        history._archived = sum(size for size, _ in history._chunks)
+        history.dropped = data["dropped"]
+        return history
+
+    def clear(self):
+        self._recent.clear()
+        self._chunks.clear()
+        self._archived = 0
+        self.dropped = 0
+
+    def _compact(self):
+        batch = [self._recent.popleft() for _ in range(min(self.chunk_size, len(self._recent)))]
+        if len(self._chunks) == self._chunks.maxlen:
+            oldest_size, _ = self._chunks[0]
+            self._archived -= oldest_size
+            self.dropped += oldest_size
+        blob = zlib.compress(json.dumps(batch, separators=(",", ":")).encode("utf-8"))
+        self._chunks.append((len(batch), blob))
+        self._archived += len(batch)
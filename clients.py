@@ -0,0 +1,68 @@
+import logging
+import threading
+import time
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+
+def initialize_dialogflow_client(credentials):
+    from google.cloud import dialogflowcx_v3beta1 as dialogflow_cx
+    return dialogflow_cx.SessionsClient(credentials=credentials)
+
+
+def initialize_firestore_client(credentials, project_id):
+    from google.cloud import firestore
+    return firestore.Client(credentials=credentials, project=project_id)
+
+
+class ClientManager:
+    """Creates each Google client once per process and hands out the shared instance.
+
+    A SessionsClient owns a single gRPC channel, so sharing one instance shares the
+    channel across every Streamlit session. Nothing is built until it is first
+    asked for; Firestore in particular is only created by features that use it.
+    ``dialogflow_factory`` replaces the real SessionsClient, e.g. with a local
+    stand-in for load tests; it is called without credentials.
+    """
+
+    def __init__(self, credentials_loader, project_id, dialogflow_factory=None):
+        self._credentials_loader = credentials_loader
+        self._dialogflow_factory = dialogflow_factory
+        self.project_id = project_id
+        self._clients = {}
+        self._timings = {}
+        self._lock = threading.RLock()
+
+    def credentials(self):
+        return self._get("credentials", self._credentials_loader)
+
+    def dialogflow(self):
+        if self._dialogflow_factory is not None:
+            return self._get("dialogflow", self._dialogflow_factory)
+        return self._get("dialogflow", lambda: initialize_dialogflow_client(self.credentials()))
+
+    def firestore(self):
+        return self._get("firestore", lambda: initialize_firestore_client(self.credentials(), self.project_id))
+
+    def is_initialized(self, name):
+        return name in self._clients
+
+    def init_timings(self):
+        """Seconds spent creating each client, keyed by client name."""
+        with self._lock:
+            return dict(self._timings)
+
+    def _get(self, name, factory):
+        instance = self._clients.get(name)
+        if instance is not None:
+            return instance
+        with self._lock:
+            if name not in self._clients:
+                started = time.perf_counter()
+                self._clients[name] = factory()
+                self._timings[name] = time.perf_counter() - started
+                metrics.observe("stage_seconds", self._timings[name], stage=f"init_{name}")
+                logger.info("Initialized %s client in %.3fs", name, self._timings[name])
+            return self._clients[name]
@@ -0,0 +1,98 @@
+import os
+import random
+import threading
+import time
+
+import metrics
+
+QUESTION_TEMPLATE = (
+    "Question {number}: Which of the following best describes concept {number}?\n"
+    "A) First option  B) Second option  C) Third option  D) Fourth option\n"
+    "Answer: {answer}\n"
+)
+
+
+def fake_response_parts(prompt, chars):
+    """Roughly ``chars`` characters of quiz-shaped text, so memos and PDFs do real work."""
+    parts = [f"Generated for: {prompt}\n"]
+    length = len(parts[0])
+    while length < chars:
+        number = len(parts)
+        parts.append(QUESTION_TEMPLATE.format(number=number, answer="ABCD"[number % 4]))
+        length += len(parts[-1])
+    return parts
+
+
+class FakeSessionsClient:
+    """Local stand-in for the Dialogflow CX ``SessionsClient`` used by load tests.
+
+    Supports ``detect_intent`` and ``server_streaming_detect_intent`` with the same
+    request and response types as the real client. Each call sleeps for ``latency``
+    seconds (plus up to ``jitter``), fails with a retryable error with probability
+    ``error_rate`` and answers with about ``response_chars`` characters of text,
+    streamed in ``stream_chunks`` partial responses.
+    """
+
+    def __init__(self, latency=0.5, jitter=0.2, error_rate=0.0, response_chars=2000, stream_chunks=4, seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.response_chars = response_chars
+        self.stream_chunks = stream_chunks
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.calls = 0
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            latency=float(os.environ.get("PHBEE_FAKE_LATENCY", "0.5")),
+            jitter=float(os.environ.get("PHBEE_FAKE_JITTER", "0.2")),
+            error_rate=float(os.environ.get("PHBEE_FAKE_ERROR_RATE", "0")),
+            response_chars=int(os.environ.get("PHBEE_FAKE_RESPONSE_CHARS", "2000")),
+        )
+
+    def detect_intent(self, request=None, timeout=None, **kwargs):
+        self._simulate_call(timeout)
+        text = "".join(fake_response_parts(request.query_input.text.text, self.response_chars))
+        return self._response([text], final=True)
+
+    def server_streaming_detect_intent(self, request=None, timeout=None, **kwargs):
+        self._simulate_call(timeout, fraction=1 / max(1, self.stream_chunks))
+        # Each partial response adds a group of whole questions as a new message
+        parts = fake_response_parts(request.query_input.text.text, self.response_chars)
+        size = -(-len(parts) // max(1, self.stream_chunks))
+        messages = ["".join(parts[start:start + size]).strip() for start in range(0, len(parts), size)]
+        for index in range(1, len(messages) + 1):
+            if index > 1:
+                time.sleep(self._delay() / max(1, self.stream_chunks))
+            yield self._response(messages[:index], final=index == len(messages))
+
+    def _delay(self):
+        with self._lock:
+            return self.latency + self._random.uniform(0, self.jitter)
+
+    def _simulate_call(self, timeout, fraction=1.0):
+        from google.api_core import exceptions
+        with self._lock:
+            self.calls += 1
+            failed = self._random.random() < self.error_rate
+        delay = self._delay() * fraction
+        if timeout is not None and delay > timeout:
+            time.sleep(timeout)
+            raise exceptions.DeadlineExceeded("Fake Dialogflow call timed out")
+        time.sleep(delay)
+        metrics.increment("fake_dialogflow_calls_total", failed=failed)
+        if failed:
+            raise exceptions.ServiceUnavailable("Fake Dialogflow error")
+
+    def _response(self, texts, final):
+        from google.cloud import dialogflowcx_v3beta1 as dialogflow_cx
+        response = dialogflow_cx.DetectIntentResponse(
+            response_type=dialogflow_cx.DetectIntentResponse.ResponseType.FINAL if final
+            else dialogflow_cx.DetectIntentResponse.ResponseType.PARTIAL,
+        )
+        response.query_result.response_messages.extend(
+            dialogflow_cx.ResponseMessage(text=dialogflow_cx.ResponseMessage.Text(text=[text])) for text in texts
+        )
+        return response
@@ -0,0 +1,131 @@
+# Task prompts and Dialogflow calls shared by the Streamlit app and the command-line
+# tools; nothing here imports Streamlit, so it works outside ``streamlit run``
+import os
+import threading
+
+import metrics
+from governor import RequestGovernor, BackendError
+
+# Define the Dialogflow parameters
+PROJECT_ID = "phoeb-426309"
+AGENT_ID = "016dc67d-53e9-49c5-acbf-dcb3069154f9"
+LANGUAGE_CODE = "en"
+
+NO_RESPONSE_TEXT = "No response from Dialogflow."
+INCOMPLETE_RESPONSE_TEXT = "The response from Dialogflow was cut off. Please try again."
+
+# Client-side request governor shared by every Dialogflow call in the process
+DIALOGFLOW_MAX_RATE = float(os.environ.get("PHBEE_DIALOGFLOW_MAX_RATE", "10"))
+DIALOGFLOW_SESSION_RATE = float(os.environ.get("PHBEE_DIALOGFLOW_SESSION_RATE", "1"))
+# Bulk jobs get their own per-user bucket, sized so a whole year of lesson plans (40 items) is
+# admitted at once; app.py sizes the bulk thread pool to match
+BULK_RATE_CLASS = "bulk"
+DIALOGFLOW_BULK_RATE = float(os.environ.get("PHBEE_DIALOGFLOW_BULK_RATE", "2"))
+DIALOGFLOW_BULK_BURST = int(os.environ.get("PHBEE_DIALOGFLOW_BULK_BURST", "40"))
+DIALOGFLOW_DEADLINE_SECONDS = 60
+
+_governor = None
+_governor_lock = threading.Lock()
+
+
+def get_request_governor():
+    global _governor
+    with _governor_lock:
+        if _governor is None:
+            _governor = RequestGovernor(
+                max_rate=DIALOGFLOW_MAX_RATE,
+                session_rate=DIALOGFLOW_SESSION_RATE,
+                session_limits={BULK_RATE_CLASS: (DIALOGFLOW_BULK_RATE, DIALOGFLOW_BULK_BURST)},
+                deadline=DIALOGFLOW_DEADLINE_SECONDS,
+            )
+        return _governor
+
+
+# Function to generate a task description
+def generate_task_description(task_type, subject, grade, curriculum, num_questions_or_term, total_marks_or_week):
+    if task_type.lower() == "lesson plan":
+        return (
+            f"Create a detailed {task_type} for the {subject} subject, targeting grade {grade} students under the "
+            f"{curriculum} curriculum. The lesson plan should cover term {num_questions_or_term} and week {total_marks_or_week}."
+        )
+    else:
+        return (
+            f"Create a detailed {task_type} for the {subject} subject, targeting grade {grade} students under the "
+            f"{curriculum} curriculum. The task should include {num_questions_or_term} questions, each with 4 options, "
+            f"and the total marks should sum up to {total_marks_or_week}."
+        )
+
+
+def build_detect_intent_request(project_id, agent_id, session_id, text, language_code="en", session_ttl=None):
+    from google.cloud import dialogflowcx_v3beta1 as dialogflow_cx
+    session_path = f"projects/{project_id}/locations/global/agents/{agent_id}/sessions/{session_id}"
+    text_input = dialogflow_cx.TextInput(text=text)
+    query_input = dialogflow_cx.QueryInput(text=text_input, language_code=language_code)
+    query_params = dialogflow_cx.QueryParameters(session_ttl=session_ttl) if session_ttl else None
+    return dialogflow_cx.DetectIntentRequest(session=session_path, query_input=query_input, query_params=query_params)
+
+
+def response_texts(query_result):
+    """All text of every response message, in order."""
+    return [text for message in query_result.response_messages for text in message.text.text if text]
+
+
+def detect_intent_text(client, project_id, agent_id, session_id, text, language_code="en", rate_key=None, session_ttl=None,
+                       rate_class=None):
+    """Return Dialogflow's reply to ``text``. Raises ``BackendError`` rather than returning error text.
+
+    Calls go through the request governor; ``rate_key`` (default: ``session_id``)
+    selects the per-session rate limit and ``rate_class`` which of its buckets.
+    """
+    request = build_detect_intent_request(project_id, agent_id, session_id, text, language_code, session_ttl)
+    with metrics.timer("dialogflow_detect_intent"):
+        response = get_request_governor().call(
+            lambda timeout: client.detect_intent(request=request, timeout=timeout),
+            session_key=rate_key or session_id,
+            rate_class=rate_class,
+        )
+    texts = response_texts(response.query_result)
+    if not texts:
+        raise BackendError(NO_RESPONSE_TEXT)
+    return "\n\n".join(texts)
+
+
+def new_messages(emitted, texts):
+    """The messages of a partial response not yet emitted.
+
+    A cumulative partial starts with everything emitted so far; a delta partial may
+    repeat the last few. Only that overlap (the longest tail of ``emitted`` that
+    ``texts`` starts with) is dropped, so a message that legitimately repeats an
+    earlier one is kept.
+    """
+    for overlap in range(min(len(emitted), len(texts)), 0, -1):
+        if emitted[len(emitted) - overlap:] == texts[:overlap]:
+            return texts[overlap:]
+    return texts
+
+
+def stream_intent_text(client, project_id, agent_id, session_id, text, language_code="en", rate_key=None, session_ttl=None):
+    """Yield response text as Dialogflow produces it, using server-streaming detect intent.
+
+    Partial responses may either repeat the messages sent so far plus new ones or
+    carry only the new ones; both are handled so every message is yielded once.
+    Raises ``BackendError`` if the call fails, produces no text or ends on a
+    partial response, so a truncated reply is never taken (or cached) as complete.
+    """
+    from google.cloud import dialogflowcx_v3beta1 as dialogflow_cx
+    emitted = []
+    complete = False
+    request = build_detect_intent_request(project_id, agent_id, session_id, text, language_code, session_ttl)
+    responses = get_request_governor().stream(
+        lambda timeout: client.server_streaming_detect_intent(request=request, timeout=timeout),
+        session_key=rate_key or session_id,
+    )
+    for response in responses:
+        complete = response.response_type != dialogflow_cx.DetectIntentResponse.ResponseType.PARTIAL
+        for new_text in new_messages(emitted, response_texts(response.query_result)):
+            yield ("\n\n" if emitted else "") + new_text
+            emitted.append(new_text)
+    if not emitted:
+        raise BackendError(NO_RESPONSE_TEXT)
+    if not complete:
+        raise BackendError(INCOMPLETE_RESPONSE_TEXT)
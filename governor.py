@@ -0,0 +1,291 @@
+import logging
+import random
+import threading
+import time
+from collections import OrderedDict
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class BackendError(Exception):
+    """A backend call failed and produced no usable result."""
+
+
+class RateLimited(BackendError):
+    """No request slot became free before the call's deadline."""
+
+
+class CircuitOpen(BackendError):
+    """The backend is failing; calls are rejected until the breaker's cool-down ends."""
+
+
+def is_retryable(error):
+    """Transient gRPC / HTTP failures worth retrying: quota, unavailability, timeouts, aborts."""
+    from google.api_core import exceptions
+    return isinstance(error, (
+        exceptions.TooManyRequests,
+        exceptions.ResourceExhausted,
+        exceptions.ServiceUnavailable,
+        exceptions.DeadlineExceeded,
+        exceptions.InternalServerError,
+        exceptions.Aborted,
+    ))
+
+
+def is_quota_error(error):
+    from google.api_core import exceptions
+    return isinstance(error, (exceptions.TooManyRequests, exceptions.ResourceExhausted))
+
+
+class TokenBucket:
+    """Token bucket refilled at ``rate`` tokens per second, holding at most ``capacity``."""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def try_acquire(self):
+        """Take a token if one is available; otherwise return the seconds until one will be."""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0.0
+            return (1 - self._tokens) / self.rate
+
+    def refund(self):
+        with self._lock:
+            self._tokens = min(self.capacity, self._tokens + 1)
+
+
+class CircuitBreaker:
+    """Opens after ``failure_threshold`` consecutive failures and rejects calls for
+    ``reset_timeout`` seconds, then lets a single probe through (half-open).
+
+    Every call let through must end in ``record_success``, ``record_failure`` or
+    ``release_probe``; otherwise a half-open breaker waits for its probe forever.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self._transition(self.HALF_OPEN)
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.HALF_OPEN and not self._probing:
+                self._probing = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._probing = False
+            if self.state != self.CLOSED:
+                self._transition(self.CLOSED)
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._probing = False
+            if self.state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+                if self.state != self.OPEN:
+                    self._transition(self.OPEN)
+
+    def release_probe(self):
+        """Free the half-open probe slot after a call that gave no verdict on the backend."""
+        with self._lock:
+            if self.state == self.HALF_OPEN:
+                self._probing = False
+
+    def _transition(self, state):
+        logger.warning("Circuit breaker %s -> %s", self.state, state)
+        metrics.increment("circuit_breaker_transitions_total", to_state=state)
+        self.state = state
+
+
+class RequestGovernor:
+    """Client-side guard for backend calls.
+
+    Every call needs a token from the global bucket and from its session's bucket,
+    runs with a per-call deadline, is retried with jittered exponential backoff on
+    retryable errors and is rejected straight away while the circuit breaker is
+    open. The global rate adapts to quota errors: it halves on each quota error and
+    climbs back by ``rate_increase`` per success, up to ``max_rate``, so throughput
+    settles just under the backend's quota.
+
+    Session buckets refill at ``session_rate`` and hold ``session_burst`` tokens.
+    ``session_limits`` maps a rate class name to its own ``(rate, burst)``; calls
+    made with that ``rate_class`` use a separate bucket per session with those
+    limits, e.g. so a batch job doesn't drain the user's interactive allowance.
+    """
+
+    def __init__(self, max_rate=10.0, min_rate=0.5, burst=20, session_rate=1.0, session_burst=5,
+                 rate_increase=0.1, max_retries=3, base_backoff=0.5, max_backoff=8.0, deadline=60.0,
+                 breaker=None, retryable=is_retryable, quota_error=is_quota_error, max_sessions=10000,
+                 session_limits=None):
+        self.max_rate = max_rate
+        self.min_rate = min_rate
+        self.session_rate = session_rate
+        self.session_burst = session_burst
+        self.session_limits = dict(session_limits or {})
+        self.rate_increase = rate_increase
+        self.max_retries = max_retries
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.deadline = deadline
+        self.breaker = breaker or CircuitBreaker()
+        self.retryable = retryable
+        self.quota_error = quota_error
+        self.max_sessions = max_sessions
+        self.global_bucket = TokenBucket(max_rate, burst)
+        self._session_buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def rate(self):
+        return self.global_bucket.rate
+
+    def call(self, operation, session_key=None, deadline=None, rate_class=None):
+        """Run ``operation(timeout)`` under the governor and return its result.
+
+        ``timeout`` is the time left before the call's deadline and should be passed
+        on to the backend client. Raises ``BackendError`` (or a subclass) on failure.
+        """
+        expires_at = time.monotonic() + (deadline or self.deadline)
+        attempt = 0
+        while True:
+            self._admit(session_key, rate_class, expires_at)
+            try:
+                result = operation(max(0.1, expires_at - time.monotonic()))
+            except Exception as e:
+                retry = self._failed(e, attempt, expires_at)
+                if retry is None:
+                    raise BackendError(str(e)) from e
+                attempt += 1
+                time.sleep(retry)
+                continue
+            else:
+                self._succeeded()
+                return result
+            finally:
+                self.breaker.release_probe()
+
+    def stream(self, operation, session_key=None, deadline=None, rate_class=None):
+        """Like ``call`` for an ``operation(timeout)`` that returns an iterator; yields its items.
+
+        Failures before the first item are retried. Once items have been yielded a
+        retry would repeat them, so later failures are raised as ``BackendError``.
+        A stream the caller abandons part-way gives no verdict on the backend.
+        """
+        expires_at = time.monotonic() + (deadline or self.deadline)
+        attempt = 0
+        while True:
+            self._admit(session_key, rate_class, expires_at)
+            started = False
+            try:
+                for item in operation(max(0.1, expires_at - time.monotonic())):
+                    started = True
+                    yield item
+            except Exception as e:
+                if started:
+                    self._record_error(e)
+                    retry = None
+                else:
+                    retry = self._failed(e, attempt, expires_at)
+                if retry is None:
+                    raise BackendError(str(e)) from e
+                attempt += 1
+                time.sleep(retry)
+                continue
+            else:
+                self._succeeded()
+                return
+            finally:
+                self.breaker.release_probe()
+
+    def _admit(self, session_key, rate_class, expires_at):
+        if not self.breaker.allow():
+            metrics.increment("governor_rejected_total", reason="circuit_open")
+            raise CircuitOpen("The task service is temporarily unavailable. Please try again shortly.")
+        buckets = [self.global_bucket]
+        if session_key is not None:
+            buckets.append(self._session_bucket(session_key, rate_class))
+        for index, bucket in enumerate(buckets):
+            while True:
+                wait = bucket.try_acquire()
+                if wait == 0:
+                    break
+                if time.monotonic() + wait > expires_at:
+                    for acquired in buckets[:index]:
+                        acquired.refund()
+                    self.breaker.release_probe()
+                    metrics.increment("governor_rejected_total", reason="rate_limited")
+                    raise RateLimited("Too many requests right now. Please try again in a moment.")
+                metrics.increment("governor_throttled_total")
+                time.sleep(wait)
+
+    def _failed(self, error, attempt, expires_at):
+        """Record a failed attempt and return the backoff before retrying, or None to give up."""
+        if not self._record_error(error):
+            return None
+        if attempt >= self.max_retries or self.breaker.state == CircuitBreaker.OPEN:
+            return None
+        backoff = random.uniform(0, min(self.max_backoff, self.base_backoff * 2 ** attempt))
+        if time.monotonic() + backoff >= expires_at:
+            return None
+        metrics.increment("governor_retries_total", error=type(error).__name__)
+        return backoff
+
+    def _record_error(self, error):
+        """Report a failed attempt to the breaker; return whether the error is worth retrying."""
+        if not self.retryable(error):
+            # The backend answered and refused this request, so as far as the breaker cares it is up
+            self.breaker.record_success()
+            return False
+        self._record_backend_failure(error)
+        return True
+
+    def _record_backend_failure(self, error):
+        self.breaker.record_failure()
+        if self.quota_error(error):
+            with self._lock:
+                self.global_bucket.rate = max(self.min_rate, self.global_bucket.rate / 2)
+            logger.warning("Quota error, lowering request rate to %.2f/s", self.global_bucket.rate)
+
+    def _succeeded(self):
+        self.breaker.record_success()
+        with self._lock:
+            self.global_bucket.rate = min(self.max_rate, self.global_bucket.rate + self.rate_increase)
+
+    def _session_bucket(self, session_key, rate_class=None):
+        key = (rate_class, session_key)
+        with self._lock:
+            bucket = self._session_buckets.get(key)
+            if bucket is None:
+                rate, burst = self.session_limits.get(rate_class, (self.session_rate, self.session_burst))
+                bucket = self._session_buckets[key] = TokenBucket(rate, burst)
+                while len(self._session_buckets) > self.max_sessions:
+                    self._session_buckets.popitem(last=False)
+            else:
+                self._session_buckets.move_to_end(key)
+            return bucket
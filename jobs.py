@@ -0,0 +1,364 @@
+import base64
+import json
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+FINISHED_STATES = (DONE, FAILED)
+
+# Artifacts are mirrored to the result store in parts of this size, well under
+# Firestore's 1 MiB document limit once base64-encoded and compressed
+ARTIFACT_PART_BYTES = 512 * 1024
+
+
+class JobQueue:
+    """SQLite-backed job queue with a pool of worker threads.
+
+    Pages submit a job and get back its ID straight away; workers claim queued jobs,
+    run the handler registered for the job's kind and store the result. Handlers get
+    ``(payload, report)`` where ``report(text, fraction=None)`` publishes progress
+    that pollers can show while the job runs. A handler returns a JSON-serializable
+    dict; an optional ``artifact`` bytes value in it is stored as a blob. Finished
+    jobs are kept for ``retention_seconds`` and then purged.
+
+    Several queues (in one process or several sharing the file) can use the same
+    database. Each registers itself as an owner and heartbeats every
+    ``owner_timeout_seconds / 4``; a claimed job records its owner. Running jobs whose
+    owner stopped heartbeating, or whose process on this host has exited, were cut
+    off and are queued again, at startup and then every minute. With a
+    ``result_store`` (anything with ``save``, ``load`` and ``delete_many``, such as
+    a ``BatchingStateWriter``), each job's status, result and artifact are mirrored
+    there, so a queue in another process sharing that store can show the job too.
+    Progress text stays local. A job reaches the store only when the store writes it
+    (for a ``BatchingStateWriter``, at its next flush), so an unknown ID submitted
+    less than ``missing_grace_seconds`` ago is reported as queued rather than gone.
+    """
+
+    def __init__(self, db_path="phbee_jobs.sqlite3", handlers=None, workers=4,
+                 retention_seconds=24 * 3600, poll_interval=1.0, result_store=None, missing_grace_seconds=30,
+                 owner_timeout_seconds=60):
+        self.db_path = db_path
+        self.handlers = dict(handlers or {})
+        self.result_store = result_store
+        self.retention_seconds = retention_seconds
+        self.missing_grace_seconds = missing_grace_seconds
+        self.owner_timeout_seconds = owner_timeout_seconds
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex}"
+        self.poll_interval = poll_interval
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition()
+        self._stopping = threading.Event()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, timeout=30, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "id TEXT PRIMARY KEY, kind TEXT NOT NULL, payload TEXT NOT NULL, status TEXT NOT NULL, "
+            "progress TEXT, progress_fraction REAL, result TEXT, artifact BLOB, error TEXT, "
+            "created_at REAL NOT NULL, started_at REAL, finished_at REAL)"
+        )
+        if "owner" not in [column[1] for column in self._conn.execute("PRAGMA table_info(jobs)")]:
+            self._conn.execute("ALTER TABLE jobs ADD COLUMN owner TEXT")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_status_created ON jobs (status, created_at)")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS owners (token TEXT PRIMARY KEY, host TEXT NOT NULL, pid INTEGER NOT NULL, "
+            "heartbeat_at REAL NOT NULL)"
+        )
+        self._heartbeat()
+        self._requeue_orphaned()
+        self._workers = [
+            threading.Thread(target=self._work, name=f"job-worker-{index}", daemon=True)
+            for index in range(workers)
+        ]
+        self._workers.append(threading.Thread(target=self._beat, name="job-heartbeat", daemon=True))
+        for worker in self._workers:
+            worker.start()
+
+    def register(self, kind, handler):
+        self.handlers[kind] = handler
+
+    def submit(self, kind, payload):
+        if kind not in self.handlers:
+            raise ValueError(f"No handler registered for job kind {kind!r}")
+        created_at = time.time()
+        job_id = new_job_id(created_at)
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO jobs (id, kind, payload, status, created_at) VALUES (?, ?, ?, ?, ?)",
+                (job_id, kind, json.dumps(payload), QUEUED, created_at),
+            )
+        self._publish(job_id)
+        with self._wakeup:
+            self._wakeup.notify()
+        return job_id
+
+    def get(self, job_id):
+        """Return the job as a dict, or None if it doesn't exist (or was purged)."""
+        job = self._get_local(job_id)
+        if job is None and self.result_store is not None:
+            job = self._get_shared(job_id)
+            if job is None:
+                job = self._in_transit(job_id)
+        return job
+
+    def _in_transit(self, job_id):
+        """A placeholder for a job submitted elsewhere that may not have reached the result store yet."""
+        created_at = job_id_created_at(job_id)
+        if created_at is None or abs(time.time() - created_at) > self.missing_grace_seconds:
+            return None
+        return {
+            "id": job_id, "kind": None, "status": QUEUED, "progress": None, "progress_fraction": None,
+            "result": None, "artifact": None, "error": None, "created_at": created_at,
+            "started_at": None, "finished_at": None, "queue_position": None,
+        }
+
+    def _get_local(self, job_id):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT id, kind, status, progress, progress_fraction, result, artifact, error, "
+                "created_at, started_at, finished_at FROM jobs WHERE id = ?",
+                (job_id,),
+            ).fetchone()
+            if row is None:
+                return None
+            position = None
+            if row[2] == QUEUED:
+                position = self._conn.execute(
+                    "SELECT COUNT(*) FROM jobs WHERE status = ? AND created_at <= ?", (QUEUED, row[8])
+                ).fetchone()[0]
+        return {
+            "id": row[0],
+            "kind": row[1],
+            "status": row[2],
+            "progress": row[3],
+            "progress_fraction": row[4],
+            "result": json.loads(row[5]) if row[5] else None,
+            "artifact": row[6],
+            "error": row[7],
+            "created_at": row[8],
+            "started_at": row[9],
+            "finished_at": row[10],
+            "queue_position": position,
+        }
+
+    def stats(self):
+        with self._lock:
+            counts = dict(self._conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+        return {state: counts.get(state, 0) for state in (QUEUED, RUNNING, DONE, FAILED)}
+
+    def purge_expired(self):
+        with self._lock:
+            expired = self._conn.execute(
+                "SELECT id, length(artifact) FROM jobs WHERE status IN (?, ?) AND finished_at < ?",
+                (DONE, FAILED, time.time() - self.retention_seconds),
+            ).fetchall()
+            self._conn.executemany("DELETE FROM jobs WHERE id = ?", [(job_id,) for job_id, _ in expired])
+        if self.result_store is not None and expired:
+            self.result_store.delete_many([
+                key
+                for job_id, artifact_size in expired
+                for key in [job_id] + [artifact_part_key(job_id, index) for index in range(artifact_parts(artifact_size))]
+            ])
+
+    def shutdown(self, wait=True):
+        self._stopping.set()
+        with self._wakeup:
+            self._wakeup.notify_all()
+        if wait:
+            for worker in self._workers:
+                worker.join()
+            # Nothing of ours is running any more
+            with self._lock:
+                self._conn.execute("DELETE FROM owners WHERE token = ?", (self.owner,))
+
+    def _heartbeat(self):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO owners (token, host, pid, heartbeat_at) VALUES (?, ?, ?, ?)",
+                (self.owner, socket.gethostname(), os.getpid(), time.time()),
+            )
+
+    def _beat(self):
+        while not self._stopping.wait(self.owner_timeout_seconds / 4):
+            self._heartbeat()
+
+    def _requeue_orphaned(self):
+        """Queue again the running jobs whose owner is gone (or that predate owners)."""
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                gone = [
+                    (token,)
+                    for token, host, pid, heartbeat_at in self._conn.execute(
+                        "SELECT token, host, pid, heartbeat_at FROM owners WHERE token != ?", (self.owner,)
+                    ).fetchall()
+                    if not owner_alive(host, pid, heartbeat_at, now, self.owner_timeout_seconds)
+                ]
+                self._conn.executemany("DELETE FROM owners WHERE token = ?", gone)
+                requeued = self._conn.execute(
+                    "UPDATE jobs SET status = ?, owner = NULL, started_at = NULL, progress = NULL, "
+                    "progress_fraction = NULL WHERE status = ? AND (owner IS NULL OR owner NOT IN "
+                    "(SELECT token FROM owners))",
+                    (QUEUED, RUNNING),
+                ).rowcount
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        if requeued:
+            logger.warning("Requeued %s jobs whose worker process is gone", requeued)
+
+    def _claim(self):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT id, kind, payload FROM jobs WHERE status = ? ORDER BY created_at LIMIT 1", (QUEUED,)
+                ).fetchone()
+                if row is not None:
+                    self._conn.execute(
+                        "UPDATE jobs SET status = ?, owner = ?, started_at = ? WHERE id = ?",
+                        (RUNNING, self.owner, time.time(), row[0]),
+                    )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        if row is not None:
+            self._publish(row[0])
+        return row
+
+    def _report(self, job_id, text, fraction=None):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET progress = ?, progress_fraction = ? WHERE id = ?", (text, fraction, job_id)
+            )
+
+    def _finish(self, job_id, kind, status, result=None, error=None):
+        artifact = None
+        if result is not None:
+            result = dict(result)
+            artifact = result.pop("artifact", None)
+        if artifact is not None:
+            metrics.increment("job_artifact_bytes_total", len(artifact), kind=kind)
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, artifact = ?, error = ?, finished_at = ? WHERE id = ?",
+                (status, json.dumps(result) if result is not None else None, artifact, error, time.time(), job_id),
+            )
+        self._publish(job_id)
+
+    def _publish(self, job_id):
+        """Mirror the job's current status, result and artifact to the result store."""
+        if self.result_store is None:
+            return
+        job = self._get_local(job_id)
+        if job is None:
+            return
+        artifact = job.pop("artifact")
+        for local_only in ("progress", "progress_fraction", "queue_position"):
+            job.pop(local_only)
+        job["artifact_parts"] = None
+        if artifact is not None:
+            # Parts first: a reader that sees the record can then find all of them
+            job["artifact_parts"] = artifact_parts(len(artifact))
+            for index in range(job["artifact_parts"]):
+                part = artifact[index * ARTIFACT_PART_BYTES:(index + 1) * ARTIFACT_PART_BYTES]
+                self.result_store.save(artifact_part_key(job_id, index), {"data": base64.b64encode(part).decode("ascii")})
+        self.result_store.save(job_id, job)
+
+    def _get_shared(self, job_id):
+        """Load a job another process ran from the result store; finished jobs are kept locally from then on."""
+        record = self.result_store.load(job_id)
+        if record is None:
+            return None
+        job = dict(record, artifact=None, progress=None, progress_fraction=None, queue_position=None)
+        parts_count = job.pop("artifact_parts", None)
+        if parts_count is not None:
+            parts = [self.result_store.load(artifact_part_key(job_id, index)) for index in range(parts_count)]
+            if any(part is None for part in parts):
+                # Finished, but not all of it has reached the store yet
+                return dict(job, status=RUNNING, result=None)
+            job["artifact"] = b"".join(base64.b64decode(part["data"]) for part in parts)
+        if job["status"] in FINISHED_STATES:
+            with self._lock:
+                self._conn.execute(
+                    "INSERT OR IGNORE INTO jobs (id, kind, payload, status, result, artifact, error, created_at, "
+                    "started_at, finished_at) VALUES (?, ?, '{}', ?, ?, ?, ?, ?, ?, ?)",
+                    (job_id, job["kind"], job["status"], json.dumps(job["result"]) if job["result"] is not None else None,
+                     job["artifact"], job["error"], job["created_at"], job["started_at"], job["finished_at"]),
+                )
+        return job
+
+    def _work(self):
+        last_purge = 0.0
+        while not self._stopping.is_set():
+            if time.time() - last_purge > 60:
+                self.purge_expired()
+                self._requeue_orphaned()
+                last_purge = time.time()
+
+            job = self._claim()
+            if job is None:
+                with self._wakeup:
+                    self._wakeup.wait(self.poll_interval)
+                continue
+
+            job_id, kind, payload = job
+            try:
+                handler = self.handlers[kind]
+                result = handler(json.loads(payload), lambda text, fraction=None: self._report(job_id, text, fraction))
+                self._finish(job_id, kind, DONE, result=result)
+            except Exception as e:
+                logger.exception("Job %s (%s) failed", job_id, kind)
+                self._finish(job_id, kind, FAILED, error=str(e))
+
+
+def owner_alive(host, pid, heartbeat_at, now, timeout):
+    """Whether a queue that registered as an owner may still be running jobs."""
+    if now - heartbeat_at > timeout:
+        return False
+    if host == socket.gethostname() and os.name == "posix":
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            pass
+    return True
+
+
+def new_job_id(created_at):
+    """A random job ID prefixed with its submission time in milliseconds, e.g. ``18f3a2b4c5d-<uuid hex>``."""
+    return f"{int(created_at * 1000):x}-{uuid.uuid4().hex}"
+
+
+def job_id_created_at(job_id):
+    """The submission time encoded in a job ID, or None for IDs without one."""
+    stamp, separator, _ = job_id.partition("-")
+    if not separator:
+        return None
+    try:
+        return int(stamp, 16) / 1000
+    except ValueError:
+        return None
+
+
+def artifact_parts(artifact_size):
+    return -(-(artifact_size or 0) // ARTIFACT_PART_BYTES)
+
+
+def artifact_part_key(job_id, index):
+    return f"{job_id}:artifact:{index}"
@@ -0,0 +1,224 @@
+"""Multi-user load test for one PHBEE instance against a local Dialogflow stand-in.
+
+Simulates N teachers, each clicking through Chatbot, Task Generator, All Classwork
+and Free Task in their own Streamlit session (via ``streamlit.testing``), all inside
+this process, as on one server. Dialogflow is replaced by ``FakeSessionsClient``
+with configurable latency, error rate and response size. Reports throughput,
+per-page latency percentiles and memory growth per session; raise ``--teachers``
+until throughput stops rising to find where one instance saturates.
+
+    python load_test.py --teachers 10 --rounds 3
+    python load_test.py --teachers 40 --latency 1.5 --error-rate 0.02 --response-chars 8000 --json out.json
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_PATH = os.path.join(APP_DIR, "app.py")
+PAGES = ["Chatbot", "Task Generator", "All Classwork", "Free Task"]
+# Session-state key the patched sidebar menu reads, so each simulated teacher picks their own page
+PAGE_KEY = "_load_test_page"
+
+
+def rss_bytes():
+    with open("/proc/self/statm") as statm:
+        return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+
+def configure_environment(args, workdir):
+    """Point the app at the fake backend and throwaway databases before it is first run."""
+    os.environ.update({
+        "PHBEE_DIALOGFLOW_BACKEND": "fake",
+        "PHBEE_FAKE_LATENCY": str(args.latency),
+        "PHBEE_FAKE_JITTER": str(args.jitter),
+        "PHBEE_FAKE_ERROR_RATE": str(args.error_rate),
+        "PHBEE_FAKE_RESPONSE_CHARS": str(args.response_chars),
+        "PHBEE_STATE_BACKEND": "memory",
+        "PHBEE_METRICS_PORT": "0",
+    })
+    # Databases go to the scratch directory; the app still finds its images there
+    os.symlink(os.path.join(APP_DIR, "image"), os.path.join(workdir, "image"))
+    os.chdir(workdir)
+
+    import streamlit as st
+    import streamlit_option_menu
+    streamlit_option_menu.option_menu = lambda *args, **kwargs: st.session_state.get(PAGE_KEY, "Home")
+    share_test_runtime()
+
+
+def share_test_runtime():
+    """Let concurrent AppTests share one mock runtime and one compiled script.
+
+    Each AppTest run installs a mock Streamlit runtime and removes it when it ends,
+    which would pull the runtime out from under every other teacher's running
+    script; keep serving the last installed mock instead. Each run also compiles
+    app.py afresh, and CPython's parser is not safe to run from several threads at
+    once, so all runs share one (locked) script cache.
+    """
+    from streamlit.runtime import Runtime
+    from streamlit.runtime.scriptrunner.script_cache import ScriptCache
+    from streamlit.testing.v1 import app_test, local_script_runner
+    script_cache = ScriptCache()
+    app_test.ScriptCache = local_script_runner.ScriptCache = lambda: script_cache
+    last = {}
+
+    def instance(cls):
+        if cls._instance is not None:
+            last["runtime"] = cls._instance
+        elif "runtime" not in last:
+            raise RuntimeError("Runtime hasn't been created!")
+        return last["runtime"]
+
+    Runtime.instance = classmethod(instance)
+    Runtime.exists = classmethod(lambda cls: cls._instance is not None or "runtime" in last)
+
+
+def button(at, label):
+    return next(widget for widget in at.button if widget.label == label)
+
+
+def wait_for_result(at, timeout):
+    """Rerun until the page shows a download or an error, as a polling browser would."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if at.get("download_button") or at.error:
+            return not at.error
+        time.sleep(0.25)
+        at.run()
+    return False
+
+
+class Teacher:
+    def __init__(self, index, timeout):
+        from streamlit.testing.v1 import AppTest
+        self.index = index
+        self.timeout = timeout
+        self.at = AppTest.from_file(APP_PATH, default_timeout=timeout)
+
+    def visit(self, page, round_index):
+        at = self.at
+        at.session_state[PAGE_KEY] = page
+        at.run()
+        # Unique prompts, so every request reaches the backend instead of a cache
+        tag = f"{self.index}-{round_index}-{uuid.uuid4().hex[:6]}"
+        if page == "Chatbot":
+            at.text_input[0].input(f"How do I teach fractions? ({tag})")
+            at.run()
+            button(at, "Send").click()
+            at.run()
+            return not at.error
+        if page == "Task Generator":
+            at.text_input[0].input(f"Mathematics {tag}")
+            at.run()
+            button(at, "Generate Task").click()
+        elif page == "All Classwork":
+            at.text_input[0].input(f"English {tag}")
+            at.run()
+            button(at, "Generate Homework").click()
+        else:
+            at.text_area[0].input(f"A worksheet on photosynthesis for grade 7 ({tag})")
+            at.run()
+            button(at, "Generate Free Task").click()
+        at.run()
+        # A similar earlier request may be offered instead; always ask for a fresh one
+        if any(widget.label == "Generate a new one" for widget in at.button):
+            button(at, "Generate a new one").click()
+            at.run()
+        return wait_for_result(at, self.timeout)
+
+
+def run_teacher(index, args, samples, lock):
+    teacher = Teacher(index, args.timeout)
+    for round_index in range(args.rounds):
+        for page in PAGES:
+            started = time.perf_counter()
+            try:
+                ok = teacher.visit(page, round_index)
+            except Exception as e:
+                print(f"teacher {index} {page}: {e}", file=sys.stderr)
+                ok = False
+            with lock:
+                samples.append({"page": page, "seconds": time.perf_counter() - started, "ok": ok})
+            time.sleep(args.think_time)
+
+
+def summarize(samples, elapsed, teachers, rss_growth):
+    from metrics import quantile
+    pages = {}
+    for page in PAGES + ["all"]:
+        selected = [sample for sample in samples if page == "all" or sample["page"] == page]
+        latencies = sorted(sample["seconds"] for sample in selected)
+        pages[page] = {
+            "requests": len(selected),
+            "errors": sum(not sample["ok"] for sample in selected),
+            "p50": quantile(latencies, 0.5),
+            "p95": quantile(latencies, 0.95),
+            "p99": quantile(latencies, 0.99),
+            "max": latencies[-1] if latencies else 0.0,
+        }
+    return {
+        "teachers": teachers,
+        "elapsed_seconds": elapsed,
+        "throughput_per_second": len(samples) / elapsed if elapsed else 0.0,
+        "rss_growth_bytes": rss_growth,
+        "rss_per_session_bytes": rss_growth / teachers if teachers else 0,
+        "pages": pages,
+    }
+
+
+def print_report(report):
+    print(f"{report['teachers']} teachers, {report['elapsed_seconds']:.1f}s, "
+          f"{report['throughput_per_second']:.2f} page actions/s, "
+          f"{report['rss_per_session_bytes'] / 1024:.0f} KiB RSS per session")
+    print(f"{'page':<16}{'requests':>9}{'errors':>8}{'p50 s':>8}{'p95 s':>8}{'p99 s':>8}{'max s':>8}")
+    for page, stats in report["pages"].items():
+        print(f"{page:<16}{stats['requests']:>9}{stats['errors']:>8}{stats['p50']:>8.2f}"
+              f"{stats['p95']:>8.2f}{stats['p99']:>8.2f}{stats['max']:>8.2f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--teachers", type=int, default=10, help="concurrent simulated teachers")
+    parser.add_argument("--rounds", type=int, default=2, help="passes through all pages per teacher")
+    parser.add_argument("--think-time", type=float, default=0.5, help="seconds between a teacher's actions")
+    parser.add_argument("--latency", type=float, default=0.5, help="fake Dialogflow latency in seconds")
+    parser.add_argument("--jitter", type=float, default=0.2, help="extra random fake latency in seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of fake calls that fail")
+    parser.add_argument("--response-chars", type=int, default=2000, help="size of fake responses")
+    parser.add_argument("--timeout", type=float, default=120, help="seconds to wait for one page action")
+    parser.add_argument("--json", help="also write the report to this file")
+    args = parser.parse_args(argv)
+
+    json_path = os.path.abspath(args.json) if args.json else None
+    with tempfile.TemporaryDirectory(prefix="phbee-load-") as workdir:
+        configure_environment(args, workdir)
+        # Load the app once so one-off imports and client setup aren't billed to the first teachers
+        Teacher(-1, args.timeout).at.run()
+
+        samples = []
+        lock = threading.Lock()
+        rss_before = rss_bytes()
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.teachers) as executor:
+            futures = [executor.submit(run_teacher, index, args, samples, lock) for index in range(args.teachers)]
+            for future in futures:
+                future.result()
+        elapsed = time.perf_counter() - started
+        report = summarize(samples, elapsed, args.teachers, rss_bytes() - rss_before)
+
+    print_report(report)
+    if json_path:
+        with open(json_path, "w") as report_file:
+            json.dump(report, report_file, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
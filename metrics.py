@@ -0,0 +1,161 @@
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+def _label_key(labels):
+    return tuple(sorted((name, str(value)) for name, value in labels.items() if value is not None))
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(label_key, extra=()):
+    pairs = list(label_key) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def quantile(sorted_values, q):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(q * (len(sorted_values) - 1)))))
+    return sorted_values[index]
+
+
+class MetricsRegistry:
+    """Process-wide counters and latency summaries, labelled by stage and page.
+
+    Latencies keep their total count and sum plus a sliding window of the most recent
+    ``window`` samples, from which p50/p95/p99 are computed. Everything can be
+    rendered in the Prometheus text exposition format.
+    """
+
+    def __init__(self, window=2048):
+        self.window = window
+        self._counters = {}
+        self._summaries = {}
+        self._help = {}
+        self._lock = threading.Lock()
+
+    def describe(self, name, help_text):
+        self._help[name] = help_text
+
+    def increment(self, name, amount=1, **labels):
+        key = (name, _label_key(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def observe(self, name, value, **labels):
+        key = (name, _label_key(labels))
+        with self._lock:
+            summary = self._summaries.get(key)
+            if summary is None:
+                summary = self._summaries[key] = {"count": 0, "sum": 0.0, "samples": deque(maxlen=self.window)}
+            summary["count"] += 1
+            summary["sum"] += value
+            summary["samples"].append(value)
+
+    @contextmanager
+    def timer(self, stage, page=None):
+        """Time a block as ``stage_seconds``; failures also count towards ``stage_errors_total``."""
+        started = time.perf_counter()
+        try:
+            yield
+        except Exception as e:
+            self.increment("stage_errors_total", stage=stage, page=page, error=type(e).__name__)
+            raise
+        finally:
+            self.observe("stage_seconds", time.perf_counter() - started, stage=stage, page=page)
+
+    def snapshot(self):
+        """Counters and per-series latency stats as plain dicts, e.g. for the admin panel."""
+        with self._lock:
+            counters = [
+                {"name": name, "labels": dict(label_key), "value": value}
+                for (name, label_key), value in sorted(self._counters.items())
+            ]
+            summaries = []
+            for (name, label_key), summary in sorted(self._summaries.items()):
+                samples = sorted(summary["samples"])
+                entry = {"name": name, "labels": dict(label_key), "count": summary["count"], "sum": summary["sum"]}
+                entry.update({f"p{int(q * 100)}": quantile(samples, q) for q in QUANTILES})
+                summaries.append(entry)
+        return {"counters": counters, "summaries": summaries}
+
+    def render_prometheus(self):
+        lines = []
+        with self._lock:
+            counter_names = sorted({name for name, _ in self._counters})
+            for name in counter_names:
+                lines.append(f"# HELP {name} {self._help.get(name, name)}")
+                lines.append(f"# TYPE {name} counter")
+                for (series, label_key), value in sorted(self._counters.items()):
+                    if series == name:
+                        lines.append(f"{name}{_format_labels(label_key)} {value}")
+
+            summary_names = sorted({name for name, _ in self._summaries})
+            for name in summary_names:
+                lines.append(f"# HELP {name} {self._help.get(name, name)}")
+                lines.append(f"# TYPE {name} summary")
+                for (series, label_key), summary in sorted(self._summaries.items()):
+                    if series != name:
+                        continue
+                    samples = sorted(summary["samples"])
+                    for q in QUANTILES:
+                        lines.append(f"{name}{_format_labels(label_key, [('quantile', q)])} {quantile(samples, q)}")
+                    lines.append(f"{name}_sum{_format_labels(label_key)} {summary['sum']}")
+                    lines.append(f"{name}_count{_format_labels(label_key)} {summary['count']}")
+        return "\n".join(lines) + "\n"
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._summaries.clear()
+
+
+registry = MetricsRegistry()
+registry.describe("stage_seconds", "Latency of each processing stage in seconds")
+registry.describe("stage_errors_total", "Failures per processing stage")
+
+increment = registry.increment
+observe = registry.observe
+timer = registry.timer
+
+
+def start_metrics_server(port, host="127.0.0.1", metrics_registry=None):
+    """Serve ``/metrics`` in Prometheus text format from a daemon thread. Returns the server, or None if the port is taken."""
+    metrics_registry = metrics_registry or registry
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = metrics_registry.render_prometheus().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    try:
+        server = ThreadingHTTPServer((host, port), MetricsHandler)
+    except OSError as e:
+        logger.warning("Metrics endpoint not started on %s:%s: %s", host, port, e)
+        return None
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    logger.info("Serving metrics on http://%s:%s/metrics", host, server.server_port)
+    return server
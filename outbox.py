@@ -0,0 +1,250 @@
+import logging
+import random
+import smtplib
+import socket
+import sqlite3
+import threading
+import time
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+PENDING = "pending"
+SENT = "sent"
+FAILED = "failed"
+
+# The server (or the login), not the message, is the problem: stop the batch and back off
+SERVER_ERRORS = (
+    smtplib.SMTPServerDisconnected, smtplib.SMTPConnectError, smtplib.SMTPAuthenticationError,
+    ConnectionError, socket.timeout,
+)
+
+
+class EmailOutbox:
+    """Persistent email outbox drained by one background sender.
+
+    ``enqueue`` only writes the message to SQLite, so callers get an instant
+    acknowledgement. The sender thread keeps a single authenticated SMTP connection
+    open between batches, sends every due message over it and retries failures with
+    jittered exponential backoff until ``max_attempts`` is reached. The connection is
+    closed after ``idle_timeout`` seconds without mail. When connecting or logging in
+    fails, or the server drops the connection, the rest of the batch waits and the
+    whole sender backs off instead; those messages keep their attempts.
+
+    ``smtp_factory(host, port, timeout)`` defaults to ``smtplib.SMTP`` and can be
+    pointed at a local SMTP stand-in together with ``use_starttls=False``.
+    """
+
+    def __init__(self, db_path, from_email, password, host="smtp.gmail.com", port=587, use_starttls=True,
+                 smtp_factory=None, batch_size=20, max_attempts=5, backoff_seconds=5.0,
+                 max_backoff_seconds=600.0, idle_timeout=60.0, poll_interval=2.0, timeout=30.0):
+        self.db_path = db_path
+        self.from_email = from_email
+        self.password = password
+        self.host = host
+        self.port = port
+        self.use_starttls = use_starttls
+        self.smtp_factory = smtp_factory
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.backoff_seconds = backoff_seconds
+        self.max_backoff_seconds = max_backoff_seconds
+        self.idle_timeout = idle_timeout
+        self.poll_interval = poll_interval
+        self.timeout = timeout
+        self._smtp = None
+        self._last_used = 0.0
+        self._server_failures = 0
+        self._paused_until = 0.0
+        self._stats = {"sent": 0, "failed": 0, "retries": 0, "connections": 0, "server_failures": 0}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition()
+        self._stopping = threading.Event()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, timeout=30)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS outbox ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, to_email TEXT NOT NULL, subject TEXT NOT NULL, "
+            "body TEXT NOT NULL, status TEXT NOT NULL, attempts INTEGER NOT NULL DEFAULT 0, "
+            "next_attempt_at REAL NOT NULL, last_error TEXT, created_at REAL NOT NULL, sent_at REAL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS outbox_due ON outbox (status, next_attempt_at)")
+        self._conn.commit()
+        self._sender = threading.Thread(target=self._run, name="email-outbox", daemon=True)
+        self._sender.start()
+
+    def enqueue(self, to_email, subject, body):
+        """Persist a message for sending and return its outbox ID."""
+        now = time.time()
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT INTO outbox (to_email, subject, body, status, next_attempt_at, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (to_email, subject, body, PENDING, now, now),
+            )
+            self._conn.commit()
+        with self._wakeup:
+            self._wakeup.notify()
+        return cursor.lastrowid
+
+    def status(self, message_id):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT status, attempts, last_error FROM outbox WHERE id = ?", (message_id,)
+            ).fetchone()
+        return None if row is None else {"status": row[0], "attempts": row[1], "last_error": row[2]}
+
+    def stats(self):
+        with self._lock:
+            counts = dict(self._conn.execute("SELECT status, COUNT(*) FROM outbox GROUP BY status").fetchall())
+            stats = dict(self._stats)
+        stats.update({f"{state}_total": counts.get(state, 0) for state in (PENDING, SENT, FAILED)})
+        return stats
+
+    def flush(self, timeout=30.0):
+        """Block until nothing is due, e.g. before shutdown. Returns True if drained."""
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            with self._lock:
+                due = self._conn.execute(
+                    "SELECT COUNT(*) FROM outbox WHERE status = ? AND next_attempt_at <= ?", (PENDING, time.time())
+                ).fetchone()[0]
+            if not due:
+                return True
+            with self._wakeup:
+                self._wakeup.notify()
+            time.sleep(0.05)
+        return False
+
+    def shutdown(self, wait=True):
+        self._stopping.set()
+        with self._wakeup:
+            self._wakeup.notify_all()
+        if wait:
+            self._sender.join()
+
+    def _run(self):
+        while not self._stopping.is_set():
+            try:
+                sent_any = self._send_due()
+            except Exception:
+                logger.exception("Email outbox sender failed")
+                sent_any = False
+            if not sent_any:
+                if self._smtp is not None and time.time() - self._last_used > self.idle_timeout:
+                    self._disconnect()
+                with self._wakeup:
+                    self._wakeup.wait(self.poll_interval)
+        self._disconnect()
+
+    def _due_batch(self):
+        with self._lock:
+            return self._conn.execute(
+                "SELECT id, to_email, subject, body, attempts FROM outbox "
+                "WHERE status = ? AND next_attempt_at <= ? ORDER BY next_attempt_at LIMIT ?",
+                (PENDING, time.time(), self.batch_size),
+            ).fetchall()
+
+    def _send_due(self):
+        if time.time() < self._paused_until:
+            return False
+        batch = self._due_batch()
+        if not batch:
+            return False
+        for message_id, to_email, subject, body, attempts in batch:
+            try:
+                smtp = self._connection()
+            except Exception as e:
+                self._back_off(e)
+                return False
+            try:
+                with metrics.timer("smtp_send"):
+                    smtp.sendmail(self.from_email, to_email, self._build_message(to_email, subject, body))
+            except SERVER_ERRORS as e:
+                self._disconnect()
+                self._back_off(e)
+                return False
+            except Exception as e:
+                # The connection may be unusable after any failure; reconnect on the next attempt
+                self._disconnect()
+                self._mark_failed_attempt(message_id, attempts + 1, e)
+                continue
+            self._last_used = time.time()
+            self._mark_sent(message_id)
+        return True
+
+    def _connection(self):
+        if self._smtp is not None:
+            return self._smtp
+        factory = self.smtp_factory or smtplib.SMTP
+        with metrics.timer("smtp_connect"):
+            smtp = factory(self.host, self.port, timeout=self.timeout)
+            try:
+                if self.use_starttls:
+                    smtp.starttls()
+                if self.password:
+                    smtp.login(self.from_email, self.password)
+            except Exception:
+                smtp.close()
+                raise
+        self._smtp = smtp
+        self._server_failures = 0
+        self._stats["connections"] += 1
+        return smtp
+
+    def _back_off(self, error):
+        """Pause the sender with jittered exponential backoff; due messages stay pending untouched."""
+        self._server_failures += 1
+        delay = min(self.max_backoff_seconds, self.backoff_seconds * 2 ** (self._server_failures - 1))
+        delay *= random.uniform(0.5, 1.0)
+        self._paused_until = time.time() + delay
+        self._stats["server_failures"] += 1
+        logger.warning("SMTP server unavailable (%s failures in a row), pausing the outbox for %.0fs: %s",
+                       self._server_failures, delay, error)
+
+    def _disconnect(self):
+        if self._smtp is None:
+            return
+        try:
+            self._smtp.quit()
+        except Exception:
+            pass
+        self._smtp = None
+
+    def _build_message(self, to_email, subject, body):
+        from email.mime.text import MIMEText
+        from email.mime.multipart import MIMEMultipart
+
+        msg = MIMEMultipart()
+        msg["From"] = self.from_email
+        msg["To"] = to_email
+        msg["Subject"] = subject
+        msg.attach(MIMEText(body, "plain"))
+        return msg.as_string()
+
+    def _mark_sent(self, message_id):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE outbox SET status = ?, sent_at = ?, attempts = attempts + 1, last_error = NULL WHERE id = ?",
+                (SENT, time.time(), message_id),
+            )
+            self._conn.commit()
+            self._stats["sent"] += 1
+
+    def _mark_failed_attempt(self, message_id, attempts, error):
+        logger.warning("Sending outbox message %s failed (attempt %s): %s", message_id, attempts, error)
+        with self._lock:
+            if attempts >= self.max_attempts:
+                self._conn.execute(
+                    "UPDATE outbox SET status = ?, attempts = ?, last_error = ? WHERE id = ?",
+                    (FAILED, attempts, str(error), message_id),
+                )
+                self._stats["failed"] += 1
+            else:
+                delay = min(self.max_backoff_seconds, self.backoff_seconds * 2 ** (attempts - 1))
+                self._conn.execute(
+                    "UPDATE outbox SET attempts = ?, last_error = ?, next_attempt_at = ? WHERE id = ?",
+                    (attempts, str(error), time.time() + delay * random.uniform(0.5, 1.0), message_id),
+                )
+                self._stats["retries"] += 1
+            self._conn.commit()
@@ -0,0 +1,123 @@
+import datetime
+import importlib
+import io
+import multiprocessing
+import os
+import threading
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+
+# Below this many documents a batch is rendered inline; pool hand-off would cost more than it saves
+MIN_PARALLEL_DOCUMENTS = 4
+
+
+def create_memo(response_text):
+    memo = "\nMemo:\n"
+    questions = response_text.split("\n")
+    for question in questions:
+        if "Answer:" in question:
+            memo += question + "\n"
+    return memo
+
+
+def add_task_section(pdf, task_description, response_text, task_type):
+    pdf.add_page()
+    pdf.set_font("Arial", size=12)
+    pdf.cell(200, 10, txt=f"{task_type.capitalize()} / Assessment", ln=True, align='C')
+    pdf.cell(200, 10, txt=datetime.date.today().strftime("%Y-%m-%d"), ln=True, align='C')
+    pdf.ln(10)
+
+    pdf.set_fill_color(200, 220, 255)
+    pdf.rect(x=10, y=30, w=190, h=pdf.get_y() + 10, style='F')
+
+    pdf.set_xy(10, 40)
+    pdf.multi_cell(0, 10, txt=f"Task Description:\n{task_description}\n\nResponse:\n{response_text}")
+
+    if task_type.lower() != "lesson plan":
+        memo = create_memo(response_text)
+        pdf.ln(10)
+        pdf.set_xy(10, pdf.get_y())
+        pdf.multi_cell(0, 10, txt=f"{memo}")
+
+
+def pdf_to_bytes(pdf):
+    # PyFPDF returns a latin-1 str from output(dest='S'), fpdf2 returns a bytearray
+    data = pdf.output(dest='S')
+    return data.encode('latin-1') if isinstance(data, str) else bytes(data)
+
+
+def create_pdf(task_description, response_text, task_type):
+    from fpdf import FPDF
+    pdf = FPDF()
+    add_task_section(pdf, task_description, response_text, task_type)
+    return pdf_to_bytes(pdf)
+
+
+def create_multi_section_pdf(sections):
+    """Render one PDF with a page per section; sections are dicts with task_description, response_text and task_type."""
+    from fpdf import FPDF
+    pdf = FPDF()
+    for section in sections:
+        add_task_section(pdf, section['task_description'], section['response_text'], section['task_type'])
+    return pdf_to_bytes(pdf)
+
+
+def _render_document(document):
+    return create_pdf(document['task_description'], document['response_text'], document['task_type'])
+
+
+def _init_worker():
+    # Load FPDF and its core font metrics once per worker process rather than per document
+    importlib.import_module("fpdf")
+
+
+_pool = None
+_pool_workers = 0
+_pool_lock = threading.Lock()
+
+
+def get_render_pool(processes=None):
+    """Process-wide render pool. Workers are spawned, not forked, so they never inherit server threads."""
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is None:
+            _pool_workers = processes or os.cpu_count() or 1
+            _pool = ProcessPoolExecutor(
+                max_workers=_pool_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+            )
+        return _pool
+
+
+def render_batch(documents, parallel=None):
+    """Render each document to its own PDF and return the bytes in input order.
+
+    Large batches are spread across the process pool; small ones (or ``parallel=False``)
+    are rendered in the calling process.
+    """
+    documents = list(documents)
+    if parallel is None:
+        parallel = len(documents) >= MIN_PARALLEL_DOCUMENTS and (os.cpu_count() or 1) > 1
+    if not parallel:
+        return [_render_document(document) for document in documents]
+    pool = get_render_pool()
+    chunksize = max(1, len(documents) // (_pool_workers * 4))
+    return list(pool.map(_render_document, documents, chunksize=chunksize))
+
+
+def bundle_zip(named_files):
+    """Merge ``(file_name, bytes)`` pairs into one zip archive."""
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        for file_name, data in named_files:
+            archive.writestr(file_name, data)
+    return buffer.getvalue()
+
+
+def shutdown_render_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown()
+            _pool = None
@@ -0,0 +1,161 @@
+"""Pre-generate the popular task catalog off-peak so matching requests skip Dialogflow.
+
+Every combination of the chosen task types, subjects, grades, curricula and slider
+values is turned into the same prompt the Task Generator builds, sent to Dialogflow
+on its own short-lived session, rendered to a PDF and stored in the catalog the app
+checks first. Runs are resumable: entries already in the catalog are skipped, so an
+interrupted run (or one stopped by ``--until``) picks up where it left off.
+
+    python prewarm.py --dry-run
+    python prewarm.py --subjects Mathematics "Life Sciences" --grades 10 11 12 --workers 4
+    python prewarm.py --until 05:30 --refresh-days 7
+"""
+import argparse
+import datetime
+import itertools
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from clients import ClientManager
+from generation import PROJECT_ID, AGENT_ID, LANGUAGE_CODE, generate_task_description, detect_intent_text
+from pdf_engine import create_pdf
+from response_cache import prompt_key
+from sessions import SessionPool
+from task_catalog import TaskCatalog
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+
+TASK_TYPES = ["Assessment", "Project", "Test", "Lesson Plan", "Exam"]
+GRADES = ["R", "1", "2", "3", "4", "5", "6", "7", "8", "9", "10", "11", "12"]
+CURRICULA = ["CAPS", "IEB"]
+DEFAULT_SUBJECTS = ["Mathematics", "English", "Life Sciences", "Physical Sciences"]
+DEFAULT_NUM_QUESTIONS = [5, 10]
+DEFAULT_TOTAL_MARKS = [50, 100]
+DEFAULT_TERMS = [1, 2, 3, 4]
+DEFAULT_WEEKS = [1]
+SESSION_TTL = datetime.timedelta(minutes=2)
+
+
+def catalog_items(task_types, subjects, grades, curricula, num_questions, total_marks, terms, weeks):
+    """Every task generator combination to pre-generate, with its prompt."""
+    items = []
+    for task_type, subject, grade, curriculum in itertools.product(task_types, subjects, grades, curricula):
+        if task_type == "Lesson Plan":
+            options = itertools.product(terms, weeks)
+        else:
+            options = itertools.product(num_questions, total_marks)
+        for num_questions_or_term, total_marks_or_week in options:
+            items.append({
+                'task_type': task_type,
+                'subject': subject,
+                'grade': grade,
+                'curriculum': curriculum,
+                'num_questions_or_term': num_questions_or_term,
+                'total_marks_or_week': total_marks_or_week,
+                'task_description': generate_task_description(
+                    task_type, subject, grade, curriculum, num_questions_or_term, total_marks_or_week
+                ),
+            })
+    return items
+
+
+def load_credentials_info(path=None):
+    """Service account key from ``path``, $GOOGLE_APPLICATION_CREDENTIALS or the app's Streamlit secrets."""
+    path = path or os.environ.get("GOOGLE_APPLICATION_CREDENTIALS")
+    if path:
+        with open(path) as key_file:
+            return json.load(key_file)
+    import tomllib
+    with open(os.path.join(APP_DIR, ".streamlit", "secrets.toml"), "rb") as secrets_file:
+        return tomllib.load(secrets_file)["google_service_account_key"]
+
+
+def parse_until(value):
+    """``HH:MM`` -> the next time of day it occurs, as a timestamp."""
+    until = datetime.datetime.combine(datetime.date.today(), datetime.time.fromisoformat(value))
+    if until <= datetime.datetime.now():
+        until += datetime.timedelta(days=1)
+    return until.timestamp()
+
+
+def prewarm(items, catalog, client, workers=4, stop_at=None, log=print):
+    """Generate and store ``items`` concurrently. Returns ``(generated, failed, skipped_for_time)``."""
+    pool = SessionPool()
+    generated = failed = skipped = 0
+
+    def run(item):
+        if stop_at is not None and time.time() >= stop_at:
+            return None
+        with pool.lease() as session_id:
+            response_text = detect_intent_text(
+                client, PROJECT_ID, AGENT_ID, session_id, item['task_description'], LANGUAGE_CODE,
+                session_ttl=SESSION_TTL,
+            )
+        pdf = create_pdf(item['task_description'], response_text, item['task_type'])
+        catalog.put(response_text=response_text, pdf=pdf, language_code=LANGUAGE_CODE, **item)
+        return item
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        futures = {executor.submit(run, item): item for item in items}
+        for done, future in enumerate(as_completed(futures), start=1):
+            item = futures[future]
+            label = f"{item['task_type']} / {item['subject']} / Grade {item['grade']} / {item['curriculum']}"
+            try:
+                if future.result() is None:
+                    skipped += 1
+                    continue
+                generated += 1
+                log(f"[{done}/{len(items)}] {label}")
+            except Exception as e:
+                failed += 1
+                log(f"[{done}/{len(items)}] FAILED {label}: {e}")
+    return generated, failed, skipped
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--task-types", nargs="+", default=TASK_TYPES, choices=TASK_TYPES)
+    parser.add_argument("--subjects", nargs="+", default=DEFAULT_SUBJECTS)
+    parser.add_argument("--grades", nargs="+", default=GRADES, choices=GRADES)
+    parser.add_argument("--curricula", nargs="+", default=CURRICULA, choices=CURRICULA)
+    parser.add_argument("--num-questions", nargs="+", type=int, default=DEFAULT_NUM_QUESTIONS)
+    parser.add_argument("--total-marks", nargs="+", type=int, default=DEFAULT_TOTAL_MARKS)
+    parser.add_argument("--terms", nargs="+", type=int, default=DEFAULT_TERMS, help="lesson plan terms")
+    parser.add_argument("--weeks", nargs="+", type=int, default=DEFAULT_WEEKS, help="lesson plan weeks")
+    parser.add_argument("--db", default=os.path.join(APP_DIR, "phbee_catalog.sqlite3"), help="catalog database")
+    parser.add_argument("--credentials", help="service account key file (default: the app's Streamlit secrets)")
+    parser.add_argument("--workers", type=int, default=4, help="concurrent Dialogflow calls")
+    parser.add_argument("--limit", type=int, help="generate at most this many entries in this run")
+    parser.add_argument("--refresh-days", type=float,
+                        help="regenerate entries older than this many days (default: keep existing entries)")
+    parser.add_argument("--until", type=parse_until, help="stop starting new work at this time of day (HH:MM)")
+    parser.add_argument("--dry-run", action="store_true", help="only report what would be generated")
+    args = parser.parse_args(argv)
+
+    items = catalog_items(args.task_types, args.subjects, args.grades, args.curricula,
+                          args.num_questions, args.total_marks, args.terms, args.weeks)
+    catalog = TaskCatalog(args.db)
+    max_age = None if args.refresh_days is None else args.refresh_days * 86400
+    existing = catalog.fresh_keys(max_age)
+    pending = [item for item in items if prompt_key(item['task_description'], LANGUAGE_CODE) not in existing]
+    print(f"Catalog: {len(items)} combinations, {len(items) - len(pending)} already generated, {len(pending)} to do")
+    if args.limit is not None:
+        pending = pending[:args.limit]
+    if args.dry_run or not pending:
+        return 0
+
+    from google.oauth2 import service_account
+    credentials_info = load_credentials_info(args.credentials)
+    manager = ClientManager(lambda: service_account.Credentials.from_service_account_info(credentials_info), PROJECT_ID)
+    started = time.perf_counter()
+    generated, failed, skipped = prewarm(pending, catalog, manager.dialogflow(), workers=args.workers, stop_at=args.until)
+    print(f"Generated {generated}, failed {failed}, left for the next run {skipped} "
+          f"in {time.perf_counter() - started:.0f}s; catalog holds {catalog.stats()['entries']} entries")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,170 @@
+import hashlib
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+# Words that don't change what a teacher is asking for
+STOPWORDS = frozenset(
+    "a an and about for from in into of on or please the to with me my some create make give write "
+    "generate i need want can you".split()
+)
+# Words that flip what is asked for; near-duplicates must agree on them
+NEGATIONS = frozenset("no not without never exclude excluding except dont don't".split())
+MERSENNE_PRIME = (1 << 61) - 1
+
+Match = namedtuple("Match", ["prompt", "response", "similarity"])
+
+
+def prompt_words(prompt):
+    return re.findall(r"[a-z0-9']+", prompt.lower())
+
+
+def prompt_features(prompt):
+    """Order-insensitive features of a prompt: its content words.
+
+    Whole words only, so one changed word ("adding" vs "subtracting") weighs as much
+    as any other topic word instead of being outvoted by shared spelling.
+    """
+    return {word for word in prompt_words(prompt) if word not in STOPWORDS}
+
+
+def prompt_constraints(prompt):
+    """Numbers (grades, marks, question counts) and negations; near-duplicates must agree on them."""
+    return frozenset(word for word in prompt_words(prompt) if word.isdigit() or word in NEGATIONS)
+
+
+def jaccard(a, b):
+    return len(a & b) / len(a | b) if a or b else 1.0
+
+
+def _feature_hash(feature):
+    return int.from_bytes(hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+class PromptIndex:
+    """MinHash/LSH index of past prompts and their responses for near-duplicate reuse.
+
+    Prompts are reduced to a set of content words, summarized by a MinHash signature
+    and bucketed into ``bands`` LSH bands, so a lookup only compares against prompts
+    that share at least one band. Candidates are accepted when they mention the same
+    numbers and negations and the exact Jaccard similarity of their words reaches
+    ``threshold``. The index holds at most ``max_entries`` prompts and evicts the
+    least recently used; entries and their last use are mirrored to SQLite so the
+    index (and its LRU order) is rebuilt on restart.
+    """
+
+    def __init__(self, db_path="phbee_prompts.sqlite3", num_perm=64, bands=16, threshold=0.85,
+                 max_entries=2000, seed=1):
+        if num_perm % bands:
+            raise ValueError("num_perm must be a multiple of bands")
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self._permutations = [
+            (int.from_bytes(hashlib.blake2b(f"{seed}:{index}:a".encode(), digest_size=8).digest(), "big") % MERSENNE_PRIME | 1,
+             int.from_bytes(hashlib.blake2b(f"{seed}:{index}:b".encode(), digest_size=8).digest(), "big") % MERSENNE_PRIME)
+            for index in range(num_perm)
+        ]
+        self._entries = OrderedDict()
+        self._buckets = [dict() for _ in range(bands)]
+        self._lock = threading.Lock()
+        self._stats = {"lookups": 0, "matches": 0, "evictions": 0}
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, timeout=30)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS prompts ("
+            "key TEXT PRIMARY KEY, prompt TEXT NOT NULL, response TEXT NOT NULL, updated_at REAL NOT NULL)"
+        )
+        self._conn.commit()
+        rows = self._conn.execute(
+            "SELECT key, prompt, response FROM prompts ORDER BY updated_at DESC LIMIT ?", (max_entries,)
+        ).fetchall()
+        for key, prompt, response in reversed(rows):
+            self._insert(key, prompt, response)
+
+    def signature(self, prompt, features=None):
+        if features is None:
+            features = prompt_features(prompt)
+        hashes = [_feature_hash(feature) for feature in features] or [0]
+        return tuple(
+            min((a * value + b) % MERSENNE_PRIME for value in hashes)
+            for a, b in self._permutations
+        )
+
+    def add(self, prompt, response):
+        key = hashlib.sha256(" ".join(prompt.lower().split()).encode("utf-8")).hexdigest()
+        with self._lock:
+            self._insert(key, prompt, response)
+            self._conn.execute(
+                "INSERT OR REPLACE INTO prompts (key, prompt, response, updated_at) VALUES (?, ?, ?, ?)",
+                (key, prompt, response, time.time()),
+            )
+            self._conn.commit()
+
+    def lookup(self, prompt):
+        """Return the most similar stored ``Match`` at or above the threshold, or None."""
+        features = prompt_features(prompt)
+        signature = self.signature(prompt, features)
+        constraints = prompt_constraints(prompt)
+        with self._lock:
+            self._stats["lookups"] += 1
+            candidates = set()
+            for band, band_key in enumerate(self._band_keys(signature)):
+                candidates.update(self._buckets[band].get(band_key, ()))
+
+            best = None
+            for key in candidates:
+                stored_prompt, response, stored_features, _ = self._entries[key]
+                if prompt_constraints(stored_prompt) != constraints:
+                    continue
+                similarity = jaccard(features, stored_features)
+                if similarity >= self.threshold and (best is None or similarity > best[1]):
+                    best = (key, similarity)
+            if best is None:
+                return None
+
+            key, similarity = best
+            self._entries.move_to_end(key)
+            self._conn.execute("UPDATE prompts SET updated_at = ? WHERE key = ?", (time.time(), key))
+            self._conn.commit()
+            self._stats["matches"] += 1
+            stored_prompt, response, _, _ = self._entries[key]
+            return Match(stored_prompt, response, similarity)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = len(self._entries)
+        return stats
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _band_keys(self, signature):
+        return [signature[band * self.rows:(band + 1) * self.rows] for band in range(self.bands)]
+
+    def _insert(self, key, prompt, response):
+        if key in self._entries:
+            self._remove(key)
+        features = prompt_features(prompt)
+        signature = self.signature(prompt, features)
+        self._entries[key] = (prompt, response, features, signature)
+        for band, band_key in enumerate(self._band_keys(signature)):
+            self._buckets[band].setdefault(band_key, set()).add(key)
+        while len(self._entries) > self.max_entries:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self._conn.execute("DELETE FROM prompts WHERE key = ?", (oldest,))
+            self._stats["evictions"] += 1
+
+    def _remove(self, key):
+        _, _, _, signature = self._entries.pop(key)
+        for band, band_key in enumerate(self._band_keys(signature)):
+            bucket = self._buckets[band].get(band_key)
+            if bucket is not None:
+                bucket.discard(key)
+                if not bucket:
+                    del self._buckets[band][band_key]
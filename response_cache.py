@@ -0,0 +1,146 @@
+import hashlib
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+def normalize_prompt(prompt):
+    """Collapse case and whitespace so equivalent prompts share a cache key."""
+    return " ".join(prompt.lower().split())
+
+
+def prompt_key(prompt, language_code="en"):
+    normalized = normalize_prompt(prompt)
+    return hashlib.sha256(f"{language_code}:{normalized}".encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """Two-tier response cache: an in-process LRU with TTL in front of a SQLite store.
+
+    The memory tier serves repeated prompts within one process, the SQLite tier
+    survives restarts and is shared by every process pointing at the same file.
+    Both tiers are size-bounded and evict least recently used entries first.
+    """
+
+    def __init__(self, db_path="phbee_cache.sqlite3", max_memory_entries=256,
+                 max_disk_entries=5000, ttl_seconds=7 * 24 * 3600):
+        self.db_path = db_path
+        self.max_memory_entries = max_memory_entries
+        self.max_disk_entries = max_disk_entries
+        self.ttl_seconds = ttl_seconds
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "writes": 0, "evictions": 0}
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, prompt TEXT NOT NULL, response TEXT NOT NULL, "
+            "created_at REAL NOT NULL, expires_at REAL NOT NULL, last_access REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS responses_last_access ON responses (last_access)")
+        self._conn.commit()
+
+    def get(self, prompt, language_code="en"):
+        key = prompt_key(prompt, language_code)
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                expires_at, response = entry
+                if expires_at > now:
+                    self._memory.move_to_end(key)
+                    self._stats["memory_hits"] += 1
+                    return response
+                del self._memory[key]
+
+            row = self._conn.execute(
+                "SELECT response, expires_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None and row[1] > now:
+                self._conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (now, key))
+                self._conn.commit()
+                self._remember(key, row[1], row[0])
+                self._stats["disk_hits"] += 1
+                return row[0]
+            if row is not None:
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._conn.commit()
+
+            self._stats["misses"] += 1
+            return None
+
+    def set(self, prompt, response, language_code="en", ttl_seconds=None):
+        key = prompt_key(prompt, language_code)
+        now = time.time()
+        expires_at = now + (self.ttl_seconds if ttl_seconds is None else ttl_seconds)
+        with self._lock:
+            self._remember(key, expires_at, response)
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, prompt, response, created_at, expires_at, last_access) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key, normalize_prompt(prompt), response, now, expires_at, now),
+            )
+            self._evict_disk(now)
+            self._conn.commit()
+            self._stats["writes"] += 1
+
+    def get_or_compute(self, prompt, compute, language_code="en", force=False, should_store=None):
+        """Return a cached response for ``prompt`` or call ``compute()`` and store its result.
+
+        ``force`` skips the lookup and overwrites whatever is cached. ``should_store``
+        can veto caching a computed value (e.g. backend error messages).
+        Returns a ``(response, from_cache)`` tuple.
+        """
+        if not force:
+            cached = self.get(prompt, language_code)
+            if cached is not None:
+                return cached, True
+        response = compute()
+        if should_store is None or should_store(response):
+            self.set(prompt, response, language_code)
+        return response, False
+
+    def invalidate(self, prompt, language_code="en"):
+        key = prompt_key(prompt, language_code)
+        with self._lock:
+            self._memory.pop(key, None)
+            self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            self._conn.commit()
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            self._conn.execute("DELETE FROM responses")
+            self._conn.commit()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["memory_entries"] = len(self._memory)
+            stats["disk_entries"] = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        lookups = stats["memory_hits"] + stats["disk_hits"] + stats["misses"]
+        stats["hit_rate"] = (stats["memory_hits"] + stats["disk_hits"]) / lookups if lookups else 0.0
+        return stats
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def _remember(self, key, expires_at, response):
+        self._memory[key] = (expires_at, response)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+            self._stats["evictions"] += 1
+
+    def _evict_disk(self, now):
+        self._conn.execute("DELETE FROM responses WHERE expires_at <= ?", (now,))
+        overflow = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0] - self.max_disk_entries
+        if overflow > 0:
+            self._conn.execute(
+                "DELETE FROM responses WHERE key IN "
+                "(SELECT key FROM responses ORDER BY last_access ASC LIMIT ?)",
+                (overflow,),
+            )
+            self._stats["evictions"] += overflow
@@ -0,0 +1,103 @@
+import threading
+import uuid
+from contextlib import contextmanager
+
+import metrics
+
+
+def new_session_id():
+    return str(uuid.uuid4())
+
+
+class SessionPool:
+    """Short-lived Dialogflow sessions for one-shot generation calls.
+
+    Each lease is exclusive, so concurrent calls never share (and serialize on) a
+    session. A session is retired after ``max_uses`` leases; with the default of 1
+    every call gets a fresh session and unrelated tasks can't leak into each other's
+    context. Larger values reuse sessions for a few calls, keeping at most
+    ``max_idle`` of them waiting.
+    """
+
+    def __init__(self, max_uses=1, max_idle=64):
+        self.max_uses = max_uses
+        self.max_idle = max_idle
+        self._idle = []
+        self._uses = {}
+        self._stats = {"leases": 0, "created": 0, "reused": 0, "retired": 0}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def lease(self):
+        session_id = self._acquire()
+        try:
+            yield session_id
+        finally:
+            self._release(session_id)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["idle"] = len(self._idle)
+            stats["in_use"] = len(self._uses) - len(self._idle)
+        return stats
+
+    def _acquire(self):
+        with self._lock:
+            self._stats["leases"] += 1
+            if self._idle:
+                self._stats["reused"] += 1
+                return self._idle.pop()
+            session_id = new_session_id()
+            self._uses[session_id] = 0
+            self._stats["created"] += 1
+        metrics.increment("dialogflow_sessions_created_total", kind="one_shot")
+        return session_id
+
+    def _release(self, session_id):
+        with self._lock:
+            self._uses[session_id] += 1
+            if self._uses[session_id] < self.max_uses and len(self._idle) < self.max_idle:
+                self._idle.append(session_id)
+            else:
+                del self._uses[session_id]
+                self._stats["retired"] += 1
+
+
+class ChatSession:
+    """The long-lived Dialogflow session behind one chat conversation.
+
+    Dialogflow keeps the whole conversation as context, so after ``max_turns`` turns
+    the chat moves to a new session and the agent's context starts over. The
+    visible chat history is unaffected. ``max_turns=None`` never trims.
+    """
+
+    def __init__(self, max_turns=None):
+        self.max_turns = max_turns
+        self.session_id = new_session_id()
+        self.turns = 0
+        self.rotations = 0
+
+    def next_turn(self):
+        """Return the session ID to send the next message on, rotating it if the context is full."""
+        if self.max_turns and self.turns >= self.max_turns:
+            self.rotate()
+            self.rotations += 1
+        self.turns += 1
+        return self.session_id
+
+    def to_dict(self):
+        return {"max_turns": self.max_turns, "session_id": self.session_id, "turns": self.turns, "rotations": self.rotations}
+
+    @classmethod
+    def from_dict(cls, data):
+        session = cls(data["max_turns"])
+        session.session_id = data["session_id"]
+        session.turns = data["turns"]
+        session.rotations = data["rotations"]
+        return session
+
+    def rotate(self):
+        self.session_id = new_session_id()
+        self.turns = 0
+        metrics.increment("dialogflow_sessions_created_total", kind="chat")
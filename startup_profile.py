@@ -0,0 +1,116 @@
+"""Cold-start import profiler for the PHBEE app.
+
+Imports app.py in a fresh interpreter with ``-X importtime`` and reports where the
+time goes, plus the one-off cost each page pays when its heavy dependencies are
+first imported. With ``--check`` it exits non-zero when the cold-start import time
+exceeds the budget or a page-only dependency is imported at startup.
+
+    python startup_profile.py
+    python startup_profile.py --check --budget-ms 1500
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Heavy modules that only specific pages need; none of them may load at startup
+PAGE_DEPENDENCIES = {
+    "Chatbot": ["google.oauth2.service_account", "google.cloud.dialogflowcx_v3beta1"],
+    "Task Generator": ["google.oauth2.service_account", "google.cloud.dialogflowcx_v3beta1", "fpdf"],
+    "All Classwork": ["google.oauth2.service_account", "google.cloud.dialogflowcx_v3beta1", "fpdf"],
+    "Free Task": ["google.oauth2.service_account", "google.cloud.dialogflowcx_v3beta1", "fpdf"],
+    "Feedback": ["smtplib", "email.mime.multipart", "email.mime.text"],
+}
+LAZY_MODULES = sorted({module for modules in PAGE_DEPENDENCIES.values() for module in modules})
+
+DEFAULT_BUDGET_MS = 1500
+
+
+def run_importtime(statements):
+    """Run ``statements`` in a fresh interpreter and return parsed importtime rows."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", statements],
+        cwd=APP_DIR,
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"Import failed:\n{result.stderr}")
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        rows.append({
+            "name": name.strip(),
+            "depth": (len(name) - len(name.lstrip()) - 1) // 2,
+            "self_us": int(self_us),
+            "cumulative_us": int(cumulative_us),
+        })
+    return rows
+
+
+def total_ms(rows):
+    return sum(row["cumulative_us"] for row in rows if row["depth"] == 0) / 1000
+
+
+def profile_startup(runs):
+    samples = [run_importtime("import app") for _ in range(runs)]
+    median_ms = statistics.median(total_ms(rows) for rows in samples)
+    return median_ms, samples[-1]
+
+
+def profile_pages(runs):
+    """First-use import cost of each page's dependencies on top of a started app."""
+    costs = {}
+    for page, modules in PAGE_DEPENDENCIES.items():
+        statements = "import app\n" + "".join(f"import {module}\n" for module in modules)
+        samples = []
+        for _ in range(runs):
+            rows = run_importtime(statements)
+            samples.append(sum(
+                row["cumulative_us"] for row in rows if row["depth"] == 0 and row["name"] in modules
+            ) / 1000)
+        costs[page] = statistics.median(samples)
+    return costs
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--budget-ms", type=float, default=DEFAULT_BUDGET_MS,
+                        help="maximum cold-start import time of app.py in milliseconds")
+    parser.add_argument("--runs", type=int, default=3, help="interpreter launches per measurement")
+    parser.add_argument("--top", type=int, default=15, help="number of slowest imports to list")
+    parser.add_argument("--check", action="store_true", help="exit non-zero when the budget is exceeded")
+    parser.add_argument("--skip-pages", action="store_true", help="don't profile per-page dependencies")
+    args = parser.parse_args(argv)
+
+    startup_ms, rows = profile_startup(args.runs)
+    imported = {row["name"] for row in rows}
+    eager = [module for module in LAZY_MODULES if module in imported]
+
+    print(f"Cold-start import time (median of {args.runs}): {startup_ms:.0f} ms (budget {args.budget_ms:.0f} ms)")
+    print("\nSlowest imports (top level and their direct imports):")
+    for row in sorted((row for row in rows if row["depth"] <= 1), key=lambda row: -row["cumulative_us"])[:args.top]:
+        print(f"  {row['cumulative_us'] / 1000:8.1f} ms  {row['name']}")
+
+    if not args.skip_pages:
+        print("\nFirst-use import cost per page:")
+        for page, cost_ms in profile_pages(args.runs).items():
+            print(f"  {cost_ms:8.1f} ms  {page}")
+
+    failures = []
+    if startup_ms > args.budget_ms:
+        failures.append(f"cold-start import time {startup_ms:.0f} ms exceeds budget of {args.budget_ms:.0f} ms")
+    if eager:
+        failures.append("page-only dependencies imported at startup: " + ", ".join(eager))
+    for failure in failures:
+        print(f"\nFAIL: {failure}")
+    return 1 if args.check and failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,235 @@
+import json
+import logging
+import sqlite3
+import threading
+import time
+import zlib
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Firestore documents are limited to 1 MiB; leave room for the other fields
+MAX_FIRESTORE_STATE_BYTES = 900 * 1024
+
+
+def encode_state(state):
+    return zlib.compress(json.dumps(state, separators=(",", ":")).encode("utf-8"))
+
+
+def decode_state(blob):
+    return json.loads(zlib.decompress(blob))
+
+
+class MemoryStateStore:
+    """Per-user state kept in this process only; a stand-in for tests and single-replica runs."""
+
+    def __init__(self):
+        self._states = {}
+        self._lock = threading.Lock()
+
+    def load(self, user_id):
+        with self._lock:
+            blob = self._states.get(user_id)
+        return None if blob is None else decode_state(blob)
+
+    def save_many(self, states):
+        with self._lock:
+            for user_id, state in states.items():
+                self._states[user_id] = encode_state(state)
+
+    def delete_many(self, user_ids):
+        with self._lock:
+            for user_id in user_ids:
+                self._states.pop(user_id, None)
+
+    def close(self):
+        pass
+
+
+class SQLiteStateStore:
+    """Per-user state in a SQLite file, shared by every process on the host (or on a shared volume).
+
+    ``table`` lets other keyed records (e.g. job results) live in the same file.
+    """
+
+    def __init__(self, db_path="phbee_state.sqlite3", table="user_state"):
+        self.db_path = db_path
+        self.table = table
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {table} (user_id TEXT PRIMARY KEY, data BLOB NOT NULL, updated_at REAL NOT NULL)"
+        )
+        self._conn.commit()
+
+    def load(self, user_id):
+        with self._lock:
+            row = self._conn.execute(f"SELECT data FROM {self.table} WHERE user_id = ?", (user_id,)).fetchone()
+        return None if row is None else decode_state(row[0])
+
+    def save_many(self, states):
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                f"INSERT OR REPLACE INTO {self.table} (user_id, data, updated_at) VALUES (?, ?, ?)",
+                [(user_id, encode_state(state), now) for user_id, state in states.items()],
+            )
+            self._conn.commit()
+
+    def delete_many(self, user_ids):
+        with self._lock:
+            self._conn.executemany(f"DELETE FROM {self.table} WHERE user_id = ?", [(user_id,) for user_id in user_ids])
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class FirestoreStateStore:
+    """Per-user state as one document each in a Firestore collection, written in batches."""
+
+    BATCH_LIMIT = 500
+
+    def __init__(self, client_factory, collection="phbee_user_state"):
+        self._client_factory = client_factory
+        self.collection = collection
+
+    def load(self, user_id):
+        snapshot = self._client_factory().collection(self.collection).document(user_id).get()
+        if not snapshot.exists:
+            return None
+        return decode_state(snapshot.get("data"))
+
+    def save_many(self, states):
+        client = self._client_factory()
+        collection = client.collection(self.collection)
+        items = list(states.items())
+        for start in range(0, len(items), self.BATCH_LIMIT):
+            batch = client.batch()
+            for user_id, state in items[start:start + self.BATCH_LIMIT]:
+                blob = encode_state(state)
+                if len(blob) > MAX_FIRESTORE_STATE_BYTES:
+                    logger.warning("State for %s is %s bytes, too large for Firestore; not saved", user_id, len(blob))
+                    continue
+                batch.set(collection.document(user_id), {"data": blob, "updated_at": time.time()})
+            batch.commit()
+
+    def delete_many(self, user_ids):
+        client = self._client_factory()
+        collection = client.collection(self.collection)
+        user_ids = list(user_ids)
+        for start in range(0, len(user_ids), self.BATCH_LIMIT):
+            batch = client.batch()
+            for user_id in user_ids[start:start + self.BATCH_LIMIT]:
+                batch.delete(collection.document(user_id))
+            batch.commit()
+
+    def close(self):
+        pass
+
+
+class BatchingStateWriter:
+    """Write-behind buffer in front of a state store.
+
+    ``save`` only records the latest state per user; a background thread writes
+    everything pending in one batch every ``flush_interval`` seconds, or sooner once
+    ``max_pending`` users are waiting. Repeated saves for the same user between
+    flushes cost a single write. ``load`` sees pending writes first, then the batch
+    being written, so a user always reads back what they just saved, even mid-flush.
+    """
+
+    def __init__(self, store, flush_interval=1.0, max_pending=200):
+        self.store = store
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self._pending = {}
+        # The batch handed to the store; readable until the store has it
+        self._in_flight = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._stopping = False
+        self._stats = {"saves": 0, "writes": 0, "batches": 0, "errors": 0}
+        self._writer = threading.Thread(target=self._run, name="state-writer", daemon=True)
+        self._writer.start()
+
+    def load(self, user_id):
+        with self._lock:
+            state = self._pending.get(user_id)
+            if state is None:
+                state = self._in_flight.get(user_id)
+        if state is not None:
+            return state
+        with metrics.timer("state_load"):
+            return self.store.load(user_id)
+
+    def save(self, user_id, state):
+        with self._lock:
+            self._pending[user_id] = state
+            self._stats["saves"] += 1
+            if len(self._pending) >= self.max_pending:
+                self._wakeup.notify()
+
+    def flush(self):
+        """Write everything pending now. Failed writes stay pending for the next flush."""
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+                self._in_flight = pending
+            if not pending:
+                return
+            try:
+                with metrics.timer("state_flush"):
+                    self.store.save_many(pending)
+            except Exception:
+                logger.exception("Writing %s user states failed", len(pending))
+                with self._lock:
+                    self._in_flight = {}
+                    self._stats["errors"] += 1
+                    for user_id, state in pending.items():
+                        self._pending.setdefault(user_id, state)
+                return
+            with self._lock:
+                self._in_flight = {}
+                self._stats["writes"] += len(pending)
+                self._stats["batches"] += 1
+
+    def delete_many(self, user_ids):
+        """Delete at once (not batched); pending saves for these users are dropped.
+
+        Waits for a flush in progress, so its batch cannot write the states back afterwards.
+        """
+        with self._flush_lock:
+            with self._lock:
+                for user_id in user_ids:
+                    self._pending.pop(user_id, None)
+            try:
+                self.store.delete_many(user_ids)
+            except Exception:
+                logger.exception("Deleting %s states failed", len(user_ids))
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["pending"] = len(self._pending)
+        return stats
+
+    def shutdown(self):
+        with self._lock:
+            self._stopping = True
+            self._wakeup.notify()
+        self._writer.join()
+        self.flush()
+        self.store.close()
+
+    def _run(self):
+        while True:
+            with self._lock:
+                if not self._stopping and len(self._pending) < self.max_pending:
+                    self._wakeup.wait(self.flush_interval)
+                if self._stopping:
+                    return
+            self.flush()
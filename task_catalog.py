@@ -0,0 +1,100 @@
+import datetime
+import sqlite3
+import threading
+import time
+
+from response_cache import prompt_key
+
+
+class TaskCatalog:
+    """Pre-generated tasks keyed by their prompt, with the rendered PDF alongside.
+
+    Filled off-peak by ``prewarm.py`` and read by the app before it calls Dialogflow.
+    Rows are indexed by prompt key and by the task generator's options, so both an
+    exact prompt lookup and a "what do we have for Grade 10 CAPS" query are cheap.
+    """
+
+    def __init__(self, db_path="phbee_catalog.sqlite3"):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0}
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS catalog ("
+            "key TEXT PRIMARY KEY, task_type TEXT NOT NULL, subject TEXT NOT NULL, grade TEXT NOT NULL, "
+            "curriculum TEXT NOT NULL, num_questions_or_term INTEGER, total_marks_or_week INTEGER, "
+            "task_description TEXT NOT NULL, response_text TEXT NOT NULL, pdf BLOB, rendered_on TEXT, "
+            "generated_at REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS catalog_options ON catalog (task_type, subject, grade, curriculum)"
+        )
+        self._conn.commit()
+
+    def get(self, task_description, language_code="en"):
+        """Return the entry for ``task_description`` as a dict, or None.
+
+        ``pdf`` is None when it was rendered on an earlier day, since the PDF header
+        carries the date; callers re-render from ``response_text`` then.
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT task_type, response_text, pdf, rendered_on, generated_at FROM catalog WHERE key = ?",
+                (prompt_key(task_description, language_code),),
+            ).fetchone()
+            self._stats["hits" if row is not None else "misses"] += 1
+        if row is None:
+            return None
+        today = datetime.date.today().isoformat()
+        return {
+            "task_type": row[0],
+            "response_text": row[1],
+            "pdf": row[2] if row[3] == today else None,
+            "generated_at": row[4],
+        }
+
+    def put(self, task_type, subject, grade, curriculum, num_questions_or_term, total_marks_or_week,
+            task_description, response_text, pdf=None, language_code="en"):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO catalog (key, task_type, subject, grade, curriculum, num_questions_or_term, "
+                "total_marks_or_week, task_description, response_text, pdf, rendered_on, generated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (prompt_key(task_description, language_code), task_type, subject, str(grade), curriculum,
+                 num_questions_or_term, total_marks_or_week, task_description, response_text, pdf,
+                 datetime.date.today().isoformat() if pdf is not None else None, time.time()),
+            )
+            self._conn.commit()
+
+    def fresh_keys(self, max_age_seconds=None):
+        """Prompt keys already in the catalog, optionally only those generated within ``max_age_seconds``."""
+        cutoff = 0 if max_age_seconds is None else time.time() - max_age_seconds
+        with self._lock:
+            rows = self._conn.execute("SELECT key FROM catalog WHERE generated_at >= ?", (cutoff,)).fetchall()
+        return {row[0] for row in rows}
+
+    def entries(self, task_type=None, subject=None, grade=None, curriculum=None):
+        """Catalog rows (without PDFs) matching the given options."""
+        filters = {"task_type": task_type, "subject": subject, "grade": grade, "curriculum": curriculum}
+        clauses = [(f"{name} = ?", str(value) if name == "grade" else value)
+                   for name, value in filters.items() if value is not None]
+        query = ("SELECT task_type, subject, grade, curriculum, num_questions_or_term, total_marks_or_week, "
+                 "task_description, generated_at FROM catalog")
+        if clauses:
+            query += " WHERE " + " AND ".join(clause for clause, _ in clauses)
+        with self._lock:
+            rows = self._conn.execute(query, [value for _, value in clauses]).fetchall()
+        columns = ("task_type", "subject", "grade", "curriculum", "num_questions_or_term",
+                   "total_marks_or_week", "task_description", "generated_at")
+        return [dict(zip(columns, row)) for row in rows]
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = self._conn.execute("SELECT COUNT(*) FROM catalog").fetchone()[0]
+        return stats
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
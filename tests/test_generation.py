@@ -0,0 +1,58 @@
+import uuid
+
+import pytest
+
+from fake_dialogflow import FakeSessionsClient, fake_response_parts
+from generation import (
+    INCOMPLETE_RESPONSE_TEXT, NO_RESPONSE_TEXT, new_messages, stream_intent_text,
+)
+from governor import BackendError
+
+
+class ScriptedSessionsClient(FakeSessionsClient):
+    """Streams a fixed list of ``(texts, final)`` responses."""
+
+    def __init__(self, responses):
+        super().__init__(latency=0, jitter=0)
+        self.responses = responses
+
+    def server_streaming_detect_intent(self, request=None, timeout=None, **kwargs):
+        for texts, final in self.responses:
+            yield self._response(texts, final=final)
+
+
+def stream(client, prompt="Maths quiz"):
+    return list(stream_intent_text(client, "project", "agent", "session", prompt, rate_key=uuid.uuid4().hex))
+
+
+def test_cumulative_partials_yield_each_message_once():
+    client = FakeSessionsClient(latency=0, jitter=0, response_chars=2000, stream_chunks=4)
+    chunks = stream(client)
+    assert len(chunks) == 4
+    parts = fake_response_parts("Maths quiz", 2000)
+    assert "".join(chunks).replace("\n", "") == "".join(parts).replace("\n", "")
+
+
+def test_delta_partials_keep_a_message_that_repeats_an_earlier_one():
+    client = ScriptedSessionsClient([(["Intro"], False), (["Step"], False), (["Intro"], False), (["Done"], True)])
+    assert stream(client) == ["Intro", "\n\nStep", "\n\nIntro", "\n\nDone"]
+
+
+def test_overlapping_prefix_of_a_partial_is_dropped():
+    assert new_messages(["A", "B"], ["A", "B", "C"]) == ["C"]
+    assert new_messages(["A", "B"], ["B", "C"]) == ["C"]
+    assert new_messages(["A", "B"], ["A", "C"]) == ["A", "C"]
+    assert new_messages([], ["A"]) == ["A"]
+
+
+def test_stream_ending_on_a_partial_response_is_incomplete():
+    client = ScriptedSessionsClient([(["First half"], False)])
+    chunks = stream_intent_text(client, "project", "agent", "session", "Quiz", rate_key=uuid.uuid4().hex)
+    assert next(chunks) == "First half"
+    with pytest.raises(BackendError, match=INCOMPLETE_RESPONSE_TEXT):
+        next(chunks)
+
+
+def test_empty_stream_has_no_response():
+    with pytest.raises(BackendError, match=NO_RESPONSE_TEXT):
+        stream(ScriptedSessionsClient([]))
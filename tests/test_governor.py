@@ -0,0 +1,246 @@
+import time
+
+import pytest
+
+from governor import BackendError, CircuitBreaker, CircuitOpen, RateLimited, RequestGovernor, TokenBucket
+
+
+class Transient(Exception):
+    """Stands in for a retryable backend error (unavailable, deadline exceeded)."""
+
+
+class Quota(Transient):
+    """Stands in for a quota error (resource exhausted, too many requests)."""
+
+
+class Invalid(Exception):
+    """Stands in for a non-retryable backend error (invalid argument, permission denied)."""
+
+
+def make_governor(**kwargs):
+    kwargs.setdefault("base_backoff", 0.0)
+    kwargs.setdefault("session_burst", 100)
+    return RequestGovernor(
+        retryable=lambda error: isinstance(error, Transient),
+        quota_error=lambda error: isinstance(error, Quota),
+        **kwargs,
+    )
+
+
+def failing_then(result, errors):
+    """An operation that raises each of ``errors`` in turn, then returns ``result``."""
+    errors = list(errors)
+    calls = []
+
+    def operation(timeout):
+        calls.append(timeout)
+        if errors:
+            raise errors.pop(0)
+        return result
+
+    operation.calls = calls
+    return operation
+
+
+def open_breaker(governor):
+    with pytest.raises(BackendError):
+        governor.call(failing_then("ok", [Transient("down")]))
+    assert governor.breaker.state == CircuitBreaker.OPEN
+
+
+# Token bucket
+
+def test_bucket_allows_burst_then_reports_wait():
+    bucket = TokenBucket(rate=10, capacity=2)
+    assert bucket.try_acquire() == 0
+    assert bucket.try_acquire() == 0
+    wait = bucket.try_acquire()
+    assert 0 < wait <= 0.1
+
+
+def test_bucket_refills_over_time():
+    bucket = TokenBucket(rate=100, capacity=1)
+    assert bucket.try_acquire() == 0
+    time.sleep(0.02)
+    assert bucket.try_acquire() == 0
+
+
+def test_bucket_refund_never_exceeds_capacity():
+    bucket = TokenBucket(rate=0.001, capacity=1)
+    bucket.refund()
+    assert bucket.try_acquire() == 0
+    assert bucket.try_acquire() > 0
+
+
+# Circuit breaker
+
+def test_breaker_opens_after_threshold_and_rejects():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=60)
+    breaker.record_failure()
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow()
+
+
+def test_breaker_success_resets_failure_count():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=60)
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_half_open_breaker_allows_one_probe():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+    breaker.record_failure()
+    assert breaker.allow()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert not breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.allow()
+
+
+def test_failed_probe_reopens_breaker():
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=0.05)
+    for _ in range(3):
+        breaker.record_failure()
+    time.sleep(0.06)
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow()
+
+
+def test_released_probe_lets_the_next_call_probe():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+    breaker.record_failure()
+    assert breaker.allow()
+    breaker.release_probe()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert breaker.allow()
+
+
+# Retries
+
+def test_retryable_errors_are_retried_until_success():
+    governor = make_governor(max_retries=3)
+    operation = failing_then("ok", [Transient("a"), Transient("b")])
+    assert governor.call(operation) == "ok"
+    assert len(operation.calls) == 3
+    assert governor.breaker.state == CircuitBreaker.CLOSED
+
+
+def test_gives_up_after_max_retries():
+    governor = make_governor(max_retries=2, breaker=CircuitBreaker(failure_threshold=10))
+    operation = failing_then("ok", [Transient("down")] * 5)
+    with pytest.raises(BackendError):
+        governor.call(operation)
+    assert len(operation.calls) == 3
+
+
+def test_non_retryable_error_is_raised_at_once():
+    governor = make_governor(max_retries=3)
+    operation = failing_then("ok", [Invalid("bad request")])
+    with pytest.raises(BackendError, match="bad request"):
+        governor.call(operation)
+    assert len(operation.calls) == 1
+
+
+def test_quota_error_halves_rate_and_success_raises_it():
+    governor = make_governor(max_rate=8, min_rate=1, rate_increase=0.5)
+    assert governor.call(failing_then("ok", [Quota("slow down")])) == "ok"
+    assert governor.rate == 4.5
+
+
+def test_open_breaker_rejects_without_calling():
+    governor = make_governor(max_retries=0, breaker=CircuitBreaker(failure_threshold=1, reset_timeout=60))
+    open_breaker(governor)
+    operation = failing_then("ok", [])
+    with pytest.raises(CircuitOpen):
+        governor.call(operation)
+    assert operation.calls == []
+
+
+def test_session_limits_give_a_rate_class_its_own_bucket():
+    governor = make_governor(session_rate=0.001, session_burst=1, session_limits={"bulk": (0.001, 3)})
+    for _ in range(3):
+        governor.call(failing_then("ok", []), session_key="teacher", rate_class="bulk")
+    governor.call(failing_then("ok", []), session_key="teacher")
+    with pytest.raises(RateLimited):
+        governor.call(failing_then("ok", []), session_key="teacher", deadline=0.05)
+
+
+# Half-open probes must always be released
+
+def test_non_retryable_probe_closes_breaker():
+    governor = make_governor(max_retries=0, breaker=CircuitBreaker(failure_threshold=1, reset_timeout=0))
+    open_breaker(governor)
+    with pytest.raises(BackendError):
+        governor.call(failing_then("ok", [Invalid("bad request")]))
+    assert governor.call(failing_then("ok", [])) == "ok"
+    assert governor.breaker.state == CircuitBreaker.CLOSED
+
+
+def test_rate_limited_probe_is_released():
+    governor = make_governor(
+        max_retries=0, session_rate=0.001, session_burst=1,
+        breaker=CircuitBreaker(failure_threshold=1, reset_timeout=0),
+    )
+    governor.call(failing_then("ok", []), session_key="teacher")
+    open_breaker(governor)
+    with pytest.raises(RateLimited):
+        governor.call(failing_then("ok", []), session_key="teacher", deadline=0.05)
+    assert governor.call(failing_then("ok", []), session_key="someone else") == "ok"
+
+
+def test_abandoned_stream_probe_is_released():
+    governor = make_governor(max_retries=0, breaker=CircuitBreaker(failure_threshold=1, reset_timeout=0))
+    open_breaker(governor)
+    stream = governor.stream(lambda timeout: iter(["first", "second"]))
+    assert next(stream) == "first"
+    stream.close()
+    assert list(governor.stream(lambda timeout: iter(["again"]))) == ["again"]
+    assert governor.breaker.state == CircuitBreaker.CLOSED
+
+
+def test_probe_interrupted_by_base_exception_is_released():
+    governor = make_governor(max_retries=0, breaker=CircuitBreaker(failure_threshold=1, reset_timeout=0))
+    open_breaker(governor)
+    with pytest.raises(KeyboardInterrupt):
+        governor.call(failing_then("ok", [KeyboardInterrupt()]))
+    assert governor.call(failing_then("ok", [])) == "ok"
+
+
+# Streaming
+
+def test_stream_retries_before_first_item():
+    governor = make_governor(max_retries=2)
+    attempts = []
+
+    def operation(timeout):
+        attempts.append(timeout)
+        if len(attempts) == 1:
+            raise Transient("not yet")
+        yield from ["a", "b"]
+
+    assert list(governor.stream(operation)) == ["a", "b"]
+    assert len(attempts) == 2
+
+
+def test_stream_failure_after_first_item_is_not_retried():
+    governor = make_governor(max_retries=2, breaker=CircuitBreaker(failure_threshold=10))
+    attempts = []
+
+    def operation(timeout):
+        attempts.append(timeout)
+        yield "a"
+        raise Transient("cut off")
+
+    received = []
+    with pytest.raises(BackendError, match="cut off"):
+        for item in governor.stream(operation):
+            received.append(item)
+    assert received == ["a"]
+    assert len(attempts) == 1
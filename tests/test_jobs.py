@@ -0,0 +1,170 @@
+import subprocess
+import sys
+import time
+
+import jobs
+from jobs import DONE, FAILED, QUEUED, RUNNING, JobQueue
+from state_store import BatchingStateWriter, MemoryStateStore
+
+
+def wait_for(queue, job_id, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = queue.get(job_id)
+        if job["status"] in (DONE, FAILED):
+            return job
+        time.sleep(0.01)
+    raise AssertionError(f"job {job_id} did not finish")
+
+
+def test_handler_result_and_artifact_are_stored(tmp_path):
+    def handler(payload, report):
+        report("halfway", 0.5)
+        return {"doubled": payload["value"] * 2, "artifact": b"%PDF"}
+
+    queue = JobQueue(str(tmp_path / "jobs.sqlite3"), handlers={"task": handler}, workers=1, poll_interval=0.01)
+    try:
+        job = wait_for(queue, queue.submit("task", {"value": 21}))
+    finally:
+        queue.shutdown()
+    assert job["status"] == DONE
+    assert job["result"] == {"doubled": 42}
+    assert job["artifact"] == b"%PDF"
+
+
+def test_failing_handler_marks_job_failed(tmp_path):
+    def handler(payload, report):
+        raise RuntimeError("backend down")
+
+    queue = JobQueue(str(tmp_path / "jobs.sqlite3"), handlers={"task": handler}, workers=1, poll_interval=0.01)
+    try:
+        job = wait_for(queue, queue.submit("task", {}))
+    finally:
+        queue.shutdown()
+    assert job["status"] == FAILED
+    assert job["error"] == "backend down"
+
+
+def test_jobs_running_at_startup_are_requeued(tmp_path):
+    db_path = str(tmp_path / "jobs.sqlite3")
+    queue = JobQueue(db_path, handlers={"task": lambda payload, report: {}}, workers=0)
+    job_id = queue.submit("task", {})
+    # A worker claimed it just before the process died
+    assert queue._claim()[0] == job_id
+    assert queue.get(job_id)["status"] == RUNNING
+    queue.shutdown()
+
+    restarted = JobQueue(db_path, handlers={"task": lambda payload, report: {}}, workers=0)
+    try:
+        assert restarted.get(job_id)["status"] == QUEUED
+    finally:
+        restarted.shutdown()
+
+
+def test_jobs_of_a_live_queue_on_the_same_database_are_left_alone(tmp_path):
+    db_path = str(tmp_path / "jobs.sqlite3")
+    first = JobQueue(db_path, handlers={"task": lambda payload, report: {}}, workers=0)
+    job_id = first.submit("task", {})
+    assert first._claim()[0] == job_id
+
+    second = JobQueue(db_path, handlers={"task": lambda payload, report: {}}, workers=0)
+    try:
+        assert second.get(job_id)["status"] == RUNNING
+        # The first queue's process exits without shutting down
+        exited = subprocess.Popen([sys.executable, "-c", "pass"])
+        exited.wait()
+        with first._lock:
+            first._conn.execute("UPDATE owners SET pid = ? WHERE token = ?", (exited.pid, first.owner))
+        second._requeue_orphaned()
+        assert second.get(job_id)["status"] == QUEUED
+    finally:
+        first.shutdown()
+        second.shutdown()
+
+
+def test_jobs_of_an_owner_that_stopped_heartbeating_are_requeued(tmp_path):
+    db_path = str(tmp_path / "jobs.sqlite3")
+    first = JobQueue(db_path, handlers={"task": lambda payload, report: {}}, workers=0)
+    job_id = first.submit("task", {})
+    first._claim()
+    with first._lock:
+        first._conn.execute("UPDATE owners SET heartbeat_at = ? WHERE token = ?", (time.time() - 3600, first.owner))
+
+    second = JobQueue(db_path, handlers={"task": lambda payload, report: {}}, workers=0)
+    try:
+        assert second.get(job_id)["status"] == QUEUED
+    finally:
+        first.shutdown()
+        second.shutdown()
+
+
+def test_other_queue_sees_result_and_artifact_through_shared_store(tmp_path, monkeypatch):
+    monkeypatch.setattr(jobs, "ARTIFACT_PART_BYTES", 4)
+    shared = BatchingStateWriter(MemoryStateStore(), flush_interval=0.01)
+    artifact = b"%PDF-1.3 generated on replica A"
+
+    def handler(payload, report):
+        return {"file_name": "task.pdf", "artifact": artifact}
+
+    replica_a = JobQueue(str(tmp_path / "a.sqlite3"), handlers={"task": handler}, workers=1,
+                         poll_interval=0.01, result_store=shared)
+    replica_b = JobQueue(str(tmp_path / "b.sqlite3"), workers=0, result_store=shared)
+    try:
+        job_id = replica_a.submit("task", {})
+        wait_for(replica_a, job_id)
+        job = replica_b.get(job_id)
+    finally:
+        replica_a.shutdown()
+    assert job["status"] == DONE
+    assert job["result"] == {"file_name": "task.pdf"}
+    assert job["artifact"] == artifact
+
+    # Replica B keeps its own copy and cleans the shared one up when the job expires
+    replica_b.retention_seconds = -1
+    replica_b.purge_expired()
+    replica_b.shutdown()
+    assert shared.load(job_id) is None
+    assert shared.load(jobs.artifact_part_key(job_id, 0)) is None
+    shared.shutdown()
+
+
+def test_job_unknown_everywhere_is_none(tmp_path):
+    shared = BatchingStateWriter(MemoryStateStore())
+    queue = JobQueue(str(tmp_path / "jobs.sqlite3"), workers=0, result_store=shared)
+    try:
+        assert queue.get("missing") is None
+    finally:
+        queue.shutdown()
+        shared.shutdown()
+
+
+def test_job_not_yet_in_shared_store_is_queued_until_grace_period_ends(tmp_path):
+    store = MemoryStateStore()
+    # Replica A's writer has not flushed yet; replica B reads the store directly
+    writer_a = BatchingStateWriter(store, flush_interval=60)
+    writer_b = BatchingStateWriter(store, flush_interval=60)
+    replica_a = JobQueue(str(tmp_path / "a.sqlite3"), handlers={"task": lambda payload, report: {}},
+                         workers=0, result_store=writer_a)
+    replica_b = JobQueue(str(tmp_path / "b.sqlite3"), workers=0, result_store=writer_b)
+    try:
+        job_id = replica_a.submit("task", {})
+        in_transit = replica_b.get(job_id)
+        assert in_transit["status"] == QUEUED
+        assert abs(in_transit["created_at"] - time.time()) < 5
+
+        replica_b.missing_grace_seconds = 0
+        assert replica_b.get(job_id) is None
+
+        writer_a.flush()
+        assert replica_b.get(job_id)["status"] == QUEUED
+        assert replica_b.get(job_id)["kind"] == "task"
+    finally:
+        replica_a.shutdown()
+        replica_b.shutdown()
+        writer_a.shutdown()
+        writer_b.shutdown()
+
+
+def test_job_ids_carry_their_submission_time():
+    assert jobs.job_id_created_at(jobs.new_job_id(1700000000.25)) == 1700000000.25
+    assert jobs.job_id_created_at("0123456789abcdef0123456789abcdef") is None
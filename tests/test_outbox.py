@@ -0,0 +1,112 @@
+import smtplib
+import threading
+import time
+
+from outbox import FAILED, PENDING, SENT, EmailOutbox
+
+
+class StandInSMTP:
+    """Local SMTP stand-in: records connections and messages, can refuse the next few sends or every login."""
+
+    def __init__(self, fail_sends=0, reject_login=False):
+        self.fail_sends = fail_sends
+        self.reject_login = reject_login
+        self.connections = 0
+        self.logins = []
+        self.messages = []
+        self.lock = threading.Lock()
+
+    def __call__(self, host, port, timeout=None):
+        with self.lock:
+            self.connections += 1
+        return self
+
+    def starttls(self):
+        raise AssertionError("STARTTLS should be off for the stand-in")
+
+    def login(self, user, password):
+        self.logins.append(user)
+        if self.reject_login:
+            raise smtplib.SMTPAuthenticationError(535, b"Username and Password not accepted")
+
+    def sendmail(self, from_email, to_email, message):
+        with self.lock:
+            if self.fail_sends:
+                self.fail_sends -= 1
+                raise smtplib.SMTPDataError(554, b"stand-in refused the message")
+            self.messages.append((from_email, to_email, message))
+
+    def quit(self):
+        pass
+
+    def close(self):
+        pass
+
+
+def make_outbox(tmp_path, smtp, **kwargs):
+    kwargs.setdefault("backoff_seconds", 0.0)
+    return EmailOutbox(
+        str(tmp_path / "outbox.sqlite3"), "phbee@example.com", "secret", host="localhost", port=1025,
+        use_starttls=False, smtp_factory=smtp, poll_interval=0.01, **kwargs,
+    )
+
+
+def test_burst_of_messages_shares_one_connection(tmp_path):
+    smtp = StandInSMTP()
+    outbox = make_outbox(tmp_path, smtp)
+    try:
+        ids = [outbox.enqueue("support@example.com", f"Feedback {index}", "Great app") for index in range(10)]
+        assert outbox.flush(timeout=5)
+    finally:
+        outbox.shutdown()
+    assert len(smtp.messages) == 10
+    assert smtp.connections == 1
+    assert smtp.logins == ["phbee@example.com"]
+    assert all(outbox.status(message_id)["status"] == SENT for message_id in ids)
+    assert "Subject: Feedback 0" in smtp.messages[0][2]
+
+
+def test_failed_send_is_retried_on_a_new_connection(tmp_path):
+    smtp = StandInSMTP(fail_sends=2)
+    outbox = make_outbox(tmp_path, smtp)
+    try:
+        message_id = outbox.enqueue("support@example.com", "Feedback", "Body")
+        assert outbox.flush(timeout=5)
+        status = outbox.status(message_id)
+    finally:
+        outbox.shutdown()
+    assert status["status"] == SENT
+    assert status["attempts"] == 3
+    assert smtp.connections == 3
+    assert outbox.stats()["retries"] == 2
+
+
+def test_message_fails_after_max_attempts(tmp_path):
+    smtp = StandInSMTP(fail_sends=100)
+    outbox = make_outbox(tmp_path, smtp, max_attempts=3)
+    try:
+        message_id = outbox.enqueue("support@example.com", "Feedback", "Body")
+        assert outbox.flush(timeout=5)
+        status = outbox.status(message_id)
+    finally:
+        outbox.shutdown()
+    assert status["status"] == FAILED
+    assert status["attempts"] == 3
+    assert "stand-in refused" in status["last_error"]
+
+
+def test_rejected_login_pauses_the_batch_without_spending_attempts(tmp_path):
+    smtp = StandInSMTP(reject_login=True)
+    outbox = make_outbox(tmp_path, smtp, backoff_seconds=60.0)
+    try:
+        ids = [outbox.enqueue("support@example.com", f"Feedback {index}", "Body") for index in range(20)]
+        deadline = time.time() + 5
+        while not outbox.stats()["server_failures"] and time.time() < deadline:
+            time.sleep(0.01)
+        time.sleep(0.1)
+    finally:
+        outbox.shutdown()
+    assert outbox.stats()["server_failures"] == 1
+    assert smtp.connections == 1
+    assert len(smtp.logins) == 1
+    assert all(outbox.status(message_id) == {"status": PENDING, "attempts": 0, "last_error": None} for message_id in ids)
@@ -0,0 +1,40 @@
+from prompt_index import PromptIndex
+
+
+def make_index(tmp_path, **kwargs):
+    return PromptIndex(str(tmp_path / "prompts.sqlite3"), **kwargs)
+
+
+def test_rephrased_request_matches(tmp_path):
+    index = make_index(tmp_path)
+    index.add("worksheet on adding fractions for grade 7", "adding worksheet")
+    match = index.lookup("Please create a worksheet about adding fractions for grade 7")
+    assert match is not None
+    assert match.response == "adding worksheet"
+    assert match.similarity == 1.0
+
+
+def test_one_changed_topic_word_does_not_match(tmp_path):
+    index = make_index(tmp_path)
+    index.add("worksheet on adding fractions for grade 7", "adding worksheet")
+    assert index.lookup("worksheet on subtracting fractions for grade 7") is None
+
+
+def test_negation_and_numbers_must_agree(tmp_path):
+    index = make_index(tmp_path)
+    index.add("worksheet on adding fractions for grade 7 with answers", "answered worksheet")
+    assert index.lookup("worksheet on adding fractions for grade 7 with no answers") is None
+    assert index.lookup("worksheet on adding fractions for grade 8 with answers") is None
+
+
+def test_lookup_order_survives_restart(tmp_path):
+    index = make_index(tmp_path, max_entries=2)
+    index.add("photosynthesis summary for grade 7", "photosynthesis")
+    index.add("volcano project for grade 9", "volcano")
+    # Using the older entry makes the newer one the least recently used
+    assert index.lookup("photosynthesis summary for grade 7") is not None
+
+    restarted = make_index(tmp_path, max_entries=2)
+    restarted.add("poetry quiz for grade 11", "poetry")
+    assert restarted.lookup("photosynthesis summary for grade 7") is not None
+    assert restarted.lookup("volcano project for grade 9") is None
@@ -0,0 +1,82 @@
+import pytest
+
+import response_cache
+from response_cache import ResponseCache
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(response_cache, "time", clock)
+    return clock
+
+
+def make_cache(tmp_path, **kwargs):
+    return ResponseCache(str(tmp_path / "cache.sqlite3"), **kwargs)
+
+
+def test_entries_expire_from_both_tiers(tmp_path, clock):
+    cache = make_cache(tmp_path, ttl_seconds=60)
+    cache.set("Maths quiz", "memory and disk")
+    clock.now += 59
+    assert cache.get("Maths quiz") == "memory and disk"
+    clock.now += 2
+    assert cache.get("Maths quiz") is None
+
+    cache.set("Science quiz", "disk only")
+    cache._memory.clear()
+    clock.now += 61
+    assert cache.get("Science quiz") is None
+    assert cache.stats()["disk_entries"] == 0
+    cache.close()
+
+
+def test_least_recently_used_entries_are_evicted_first(tmp_path, clock):
+    cache = make_cache(tmp_path, max_memory_entries=2, max_disk_entries=2)
+    for prompt in ("a", "b"):
+        cache.set(prompt, prompt.upper())
+        clock.now += 1
+    cache._memory.clear()
+    assert cache.get("a") == "A"
+    clock.now += 1
+    cache.set("c", "C")
+
+    # "b" was used least recently in both tiers
+    assert list(cache._memory) == [response_cache.prompt_key("a"), response_cache.prompt_key("c")]
+    assert cache.get("b") is None
+    assert cache.get("a") == "A"
+    assert cache.stats()["disk_entries"] == 2
+    cache.close()
+
+
+def test_force_recomputes_and_overwrites_the_entry(tmp_path):
+    cache = make_cache(tmp_path)
+    assert cache.get_or_compute("Maths quiz", lambda: "old") == ("old", False)
+    assert cache.get_or_compute("Maths quiz", lambda: "unused") == ("old", True)
+    assert cache.get_or_compute("Maths quiz", lambda: "new", force=True) == ("new", False)
+    assert cache.get("maths   QUIZ") == "new"
+    cache.close()
+
+    reopened = make_cache(tmp_path)
+    assert reopened.get("Maths quiz") == "new"
+    reopened.close()
+
+
+def test_disk_entries_survive_a_new_cache_on_the_same_file(tmp_path):
+    cache = make_cache(tmp_path)
+    cache.set("Maths quiz", "Question 1", language_code="en")
+    cache.close()
+
+    reopened = make_cache(tmp_path)
+    assert reopened.get("Maths quiz", language_code="en") == "Question 1"
+    assert reopened.get("Maths quiz", language_code="af") is None
+    assert reopened.stats()["disk_hits"] == 1
+    reopened.close()
@@ -0,0 +1,93 @@
+import threading
+
+import pytest
+
+from state_store import BatchingStateWriter, MemoryStateStore, SQLiteStateStore, decode_state, encode_state
+
+
+class CountingStore(MemoryStateStore):
+    def __init__(self, fail_writes=0):
+        super().__init__()
+        self.fail_writes = fail_writes
+        self.batches = []
+
+    def save_many(self, states):
+        if self.fail_writes:
+            self.fail_writes -= 1
+            raise ConnectionError("store unavailable")
+        self.batches.append(dict(states))
+        super().save_many(states)
+
+
+def test_state_round_trips_through_encoding():
+    state = {"chat_history": {"recent": [["user", "hi"]]}, "jobs": {"free_task": "abc"}}
+    assert decode_state(encode_state(state)) == state
+
+
+def test_writer_coalesces_saves_per_user():
+    store = CountingStore()
+    writer = BatchingStateWriter(store, flush_interval=60)
+    for turn in range(5):
+        writer.save("teacher", {"turn": turn})
+    writer.save("other", {"turn": 0})
+    assert writer.load("teacher") == {"turn": 4}
+    writer.flush()
+    writer.shutdown()
+    assert store.batches == [{"teacher": {"turn": 4}, "other": {"turn": 0}}]
+    assert writer.stats()["saves"] == 6
+
+
+def test_failed_write_stays_pending_without_overwriting_newer_state():
+    store = CountingStore(fail_writes=1)
+    writer = BatchingStateWriter(store, flush_interval=60)
+    writer.save("teacher", {"turn": 1})
+    writer.flush()
+    writer.save("teacher", {"turn": 2})
+    assert writer.stats()["errors"] == 1
+    writer.flush()
+    writer.shutdown()
+    assert store.load("teacher") == {"turn": 2}
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request, tmp_path):
+    if request.param == "memory":
+        return MemoryStateStore()
+    return SQLiteStateStore(str(tmp_path / "state.sqlite3"), table="job_results")
+
+
+def test_delete_many_removes_saved_and_pending_states(store):
+    writer = BatchingStateWriter(store, flush_interval=60)
+    writer.save("saved", {"a": 1})
+    writer.flush()
+    writer.save("pending", {"b": 2})
+    writer.delete_many(["saved", "pending"])
+    assert writer.load("saved") is None
+    assert writer.load("pending") is None
+    writer.shutdown()
+
+
+class SlowStore(MemoryStateStore):
+    def __init__(self):
+        super().__init__()
+        self.writing = threading.Event()
+        self.release = threading.Event()
+
+    def save_many(self, states):
+        self.writing.set()
+        self.release.wait(5)
+        super().save_many(states)
+
+
+def test_load_during_flush_reads_the_batch_being_written():
+    store = SlowStore()
+    writer = BatchingStateWriter(store, flush_interval=60)
+    writer.save("teacher", {"v": 2})
+    flusher = threading.Thread(target=writer.flush)
+    flusher.start()
+    assert store.writing.wait(5)
+    assert writer.load("teacher") == {"v": 2}
+    store.release.set()
+    flusher.join()
+    assert writer.load("teacher") == {"v": 2}
+    writer.shutdown()